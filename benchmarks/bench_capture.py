@@ -0,0 +1,132 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from frame_shot import process_frame
+from util.device import open_device
+from util.frame_cam_emulator import FrameCamEmulator
+from util.serial_reader import SerialReader
+from util.snapshot_header import SnapshotFormat
+from util.snapshot_protocol import PipelinedSnapshots, reset_steps, run_steps, snapshot_steps
+
+CASES = [
+    (SnapshotFormat.JPEG, False, False),
+    (SnapshotFormat.JPEG, True, True),
+    (SnapshotFormat.RAW_GRBG8, False, False),
+    (SnapshotFormat.RAW_GRBG8, True, True),
+    (SnapshotFormat.RAW_BGGR8, False, False),
+    (SnapshotFormat.RAW_BGGR8, True, True),
+]
+
+
+def serve(endpoint, format, width, height, interleaving, baudrate, snapshot_delay, corrupt_every, use_socket, stop_event):
+    # Emulator runs in its own process, so its CPU time is not counted
+    emulator = FrameCamEmulator(format, width, height, interleaving, baudrate, snapshot_delay, corrupt_every=corrupt_every)
+    endpoint.send(emulator.listen() if use_socket else emulator.open_pty())
+    stop_event.wait()
+    emulator.stop()
+
+
+def capture(port, frames, vflip, hflip, encode, inflight):
+    # frame_shot capture loop without display, returns per-frame latencies and CPU time
+    ser = open_device(port)
+    reader = SerialReader(ser)
+    deinterleavers = {}
+    run_steps(reset_steps(), ser, reader)
+    snapshots = PipelinedSnapshots(inflight) if inflight else None
+
+    latencies = []
+    failures = 0
+    cpu_start = time.process_time()
+    start = frame_start = time.monotonic()
+    while len(latencies) < frames:
+        steps = snapshots.snapshot_steps(deinterleavers) if snapshots else snapshot_steps(deinterleavers)
+        result = run_steps(steps, ser, reader)
+        if result is None:
+            # Recovery time is part of the next frame latency
+            failures += 1
+            continue
+        frame = process_frame((*result, time.time()), vflip, hflip)
+        if encode:
+            frame.encoded("jpeg")
+        latencies.append(time.monotonic() - frame_start)
+        frame_start = time.monotonic()
+
+    wall = time.monotonic() - start
+    cpu = time.process_time() - cpu_start
+    ser.close()
+    return np.array(latencies), wall, cpu, failures
+
+
+def run_case(
+    format, vflip, hflip, frames, width, height, interleaving, baudrate, snapshot_delay, corrupt_every, use_socket, encode, inflight
+):
+    endpoint, child_endpoint = multiprocessing.Pipe()
+    stop_event = multiprocessing.Event()
+    server = multiprocessing.Process(
+        target=serve,
+        args=(child_endpoint, format, width, height, interleaving, baudrate, snapshot_delay, corrupt_every, use_socket, stop_event),
+        daemon=True,
+    )
+    server.start()
+    port = endpoint.recv()
+
+    try:
+        latencies, wall, cpu, failures = capture(port, frames, vflip, hflip, encode, inflight)
+    finally:
+        stop_event.set()
+        server.join()
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    flips = "+".join(name for name, flip in (("hflip", hflip), ("vflip", vflip)) if flip) or "no flip"
+    print(
+        f"[INFO] {format.name:>9} {flips:>11}: {frames / wall:6.1f}fps, latency p50 {p50:.1f}ms p95 {p95:.1f}ms p99 {p99:.1f}ms, "
+        f"CPU {cpu / frames * 1000:.1f}ms per frame, {failures} failed"
+    )
+
+
+def run(
+    frames=100,
+    width=640,
+    height=480,
+    interleaving=8,
+    baudrate=None,
+    snapshot_delay=0.0,
+    corrupt_every=0,
+    socket=False,
+    encode=False,
+    inflight=0,
+):
+    link = f"{baudrate} baud" if baudrate else "full speed"
+    print(
+        f"[INFO] Capturing {frames} frames of {width}x{height} per case from the emulator, {link}, "
+        f"snapshot delay {snapshot_delay * 1000:.0f}ms, {inflight} request(s) in flight"
+    )
+    for format, vflip, hflip in CASES:
+        run_case(
+            format, vflip, hflip, frames, width, height, interleaving, baudrate, snapshot_delay, corrupt_every, socket, encode, inflight
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end capture benchmark on the FrameCam emulator")
+    parser.add_argument("-frames", type=int, default=100, help="Frames per case")
+    parser.add_argument("-width", type=int, default=640, help="Image width")
+    parser.add_argument("-height", type=int, default=480, help="Image height")
+    parser.add_argument("-interleaving", type=int, default=8, help="Raw image row interleaving")
+    parser.add_argument("-baudrate", type=int, help="Simulated link speed, full speed if not set")
+    parser.add_argument("-snapshot_delay", type=float, default=0.0, help="Emulated snapshot time, seconds")
+    parser.add_argument("-corrupt_every", metavar="N", type=int, default=0, help="Corrupt a header byte of every Nth snapshot")
+    parser.add_argument("-socket", action="store_true", help="Connect over socket:// instead of a pty")
+    parser.add_argument("-encode", action="store_true", help="Also encode every frame as JPEG (save path)")
+    parser.add_argument("-inflight", type=int, default=0, help="Pipelined snapshot requests in flight, 0 for the plain protocol")
+
+    args = parser.parse_args()
+
+    run(**vars(args))
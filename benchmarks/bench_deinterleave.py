@@ -0,0 +1,79 @@
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from util.deinterleaver import Deinterleaver
+from util.raw_image import RawImage
+
+
+def legacy_deinterleave(bayer_interleaved, interleaving):
+    # Original RawImage.deinterleave implementation
+    height, _ = bayer_interleaved.shape
+    deinterleaved = np.empty_like(bayer_interleaved)
+
+    interleaving_height = height // interleaving
+    for i in range(interleaving):
+        deinterleaved[i::interleaving] = bayer_interleaved[i * interleaving_height : (i + 1) * interleaving_height : 1]
+
+    return deinterleaved
+
+
+def run(width=1920, height=1080, interleaving=8, chunk_size=64 * 1024, repeat=200):
+    bayer_interleaved = np.random.randint(0, 256, (height, width), dtype=np.uint8)
+    payload = bayer_interleaved.tobytes()
+    chunks = [payload[i : i + chunk_size] for i in range(0, len(payload), chunk_size)]
+
+    deinterleaver = Deinterleaver(width, height, interleaving)
+    out = np.empty_like(bayer_interleaved)
+
+    def incremental():
+        deinterleaver.reset()
+        for chunk in chunks:
+            deinterleaver.feed(chunk)
+
+    def last_chunk():
+        # Cost left after the last byte of the frame arrives
+        deinterleaver.feed(chunks[-1])
+
+    # Check results
+    expected = legacy_deinterleave(bayer_interleaved, interleaving)
+    incremental()
+    assert np.array_equal(deinterleaver.output, expected)
+    assert np.array_equal(RawImage.deinterleave(bayer_interleaved, interleaving, out), expected)
+
+    print(f"[INFO] Deinterleave {width}x{height}, interleaving {interleaving}, {len(chunks)} chunks of {chunk_size} bytes")
+    cases = [
+        ("legacy", lambda: legacy_deinterleave(bayer_interleaved, interleaving)),
+        ("reused buffer", lambda: RawImage.deinterleave(bayer_interleaved, interleaving, out)),
+        ("incremental, total", incremental),
+    ]
+    for name, func in cases:
+        ms = timeit.timeit(func, number=repeat) / repeat * 1000
+        print(f"[INFO] {name:>20}: {ms:.3f}ms per frame")
+
+    # Measure last chunk separately, with the rest of the frame already fed
+    total = 0.0
+    for _ in range(repeat):
+        deinterleaver.reset()
+        for chunk in chunks[:-1]:
+            deinterleaver.feed(chunk)
+        total += timeit.timeit(last_chunk, number=1)
+    print(f"[INFO] {'incremental, last chunk':>20}: {total / repeat * 1000:.3f}ms per frame")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deinterleave micro-benchmark")
+    parser.add_argument("-width", type=int, default=1920, help="Image width")
+    parser.add_argument("-height", type=int, default=1080, help="Image height")
+    parser.add_argument("-interleaving", type=int, default=8, help="Interleaving")
+    parser.add_argument("-chunk_size", type=int, default=64 * 1024, help="Serial read chunk size")
+    parser.add_argument("-repeat", type=int, default=200, help="Number of repetitions")
+
+    args = parser.parse_args()
+
+    run(**vars(args))
@@ -0,0 +1,83 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from util.encoder import EncodeSettings, EncoderPool
+from util.frame import Frame
+from util.frame_cam_emulator import make_header, make_payload, make_test_image
+from util.snapshot_header import SnapshotFormat, SnapshotHeader
+
+CASES = [
+    ("jpeg", "default", EncodeSettings()),
+    ("jpeg", "quality 80", EncodeSettings(jpeg_quality=80)),
+    ("jpeg", "quality 95, optimized", EncodeSettings(jpeg_quality=95, jpeg_optimize=True)),
+    ("png", "default", EncodeSettings()),
+    ("png", "compression 3", EncodeSettings(png_compression=3)),
+]
+
+
+def make_frames(count, width, height):
+    # Raw frames as received, demosaiced for display as frame_shot does before saving
+    header = SnapshotHeader(make_header(SnapshotFormat.RAW_GRBG8, width, height, 0, width * height))
+    noise = np.random.default_rng(0).normal(0, 1.5, (height, width, 3))
+    frames = []
+    for seq in range(count):
+        image = np.clip(make_test_image(width, height, seq) + noise, 0, 255).astype(np.uint8)  # sensor noise, as camera images
+        frame = Frame(header, make_payload(image, SnapshotFormat.RAW_GRBG8))
+        frame.image
+        frames.append(frame)
+    return frames
+
+
+def encode_inline(frames, format, settings):
+    start = time.monotonic()
+    sizes = [len(frame.detached().encoded(format, settings)) for frame in frames]
+    return time.monotonic() - start, sizes
+
+
+def encode_pool(frames, format, settings, workers, processes):
+    pool = EncoderPool(workers, processes, settings)
+
+    # Warm up, spawned processes import OpenCV first
+    for future in [pool.submit(frame, format) for frame in frames[:workers]]:
+        future.result()
+
+    start = time.monotonic()
+    futures = [pool.submit(frame, format) for frame in frames]
+    sizes = [len(future.result()) for future in futures]
+    elapsed = time.monotonic() - start
+    pool.stop()
+    return elapsed, sizes
+
+
+def run(frames=24, width=1920, height=1080, workers=(1, 2, 4), processes=False):
+    print(f"[INFO] Encoding {frames} frames of {width}x{height} on {os.cpu_count()} CPU cores")
+    test_frames = make_frames(frames, width, height)
+    kind = "processes" if processes else "threads"
+    for format, name, settings in CASES:
+        elapsed, sizes = encode_inline(test_frames, format, settings)
+        base_fps = len(sizes) / elapsed
+        print(f"[INFO] {format.upper()} {name}: avg {np.mean(sizes) / 1024:.0f}KB")
+        print(f"[INFO]       inline: {base_fps:6.1f} frames/s")
+        for count in workers:
+            elapsed, sizes = encode_pool(test_frames, format, settings, count, processes)
+            fps = len(sizes) / elapsed
+            print(f"[INFO] {count:2d} {kind:>9}: {fps:6.1f} frames/s, {fps / base_fps:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Encode throughput of the encoder pool per worker count and settings")
+    parser.add_argument("-frames", type=int, default=24, help="Frames per case")
+    parser.add_argument("-width", type=int, default=1920, help="Frame width")
+    parser.add_argument("-height", type=int, default=1080, help="Frame height")
+    parser.add_argument("-workers", type=int, nargs="+", default=[1, 2, 4], help="Worker counts to compare")
+    parser.add_argument("-processes", action="store_true", help="Worker processes instead of threads")
+
+    args = parser.parse_args()
+
+    run(**vars(args))
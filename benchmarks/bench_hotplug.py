@@ -0,0 +1,85 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from util.device import PID_LIST, VID_LIST
+from util.device_watcher import DeviceWatcher
+
+
+def fake_ids(device):
+    # Test device nodes are named after their VID/PID
+    name = os.path.basename(device)
+    if not name.startswith("tty"):
+        return None
+    vid, pid = name[3:].split("_")
+    return int(vid, 16), int(pid, 16)
+
+
+def plug(root, delay, create_dir, name, endpoint=None):
+    # Creates a device node and its link after delay, sends the time the link appeared (monotonic clock is system wide)
+    time.sleep(delay)
+    by_id = os.path.join(root, "serial", "by-id")
+    if create_dir:
+        os.makedirs(by_id)
+    device = os.path.join(root, name)
+    open(device, "w").close()
+    os.symlink(device, os.path.join(by_id, f"usb-{name}-if00"))
+    if endpoint is not None:
+        endpoint.send(time.monotonic())
+        time.sleep(0.1)  # stay idle while the watcher reacts, on a single core exiting would delay it
+
+
+def run_case(use_inotify, create_dir, poll_interval, delay):
+    with tempfile.TemporaryDirectory() as root:
+        if not create_dir:
+            os.makedirs(os.path.join(root, "serial", "by-id"))
+
+            # Another USB serial device is plugged in first, it is ignored
+            plug(root, 0, False, "tty0403_6001")
+
+        watcher = DeviceWatcher(VID_LIST, PID_LIST, os.path.join(root, "serial", "by-id"), poll_interval, fake_ids, use_inotify)
+
+        # Plugged from another process, as udev would
+        endpoint, child_endpoint = multiprocessing.Pipe()
+        name = f"tty{VID_LIST[0]:04x}_{PID_LIST[0]:04x}"
+        plugger = multiprocessing.Process(target=plug, args=(root, delay, create_dir, name, child_endpoint))
+        plugger.start()
+        with watcher:
+            devices = watcher.wait(timeout=10)
+            found = time.monotonic()  # closing inotify takes a while in the kernel, not part of the latency
+        plugged = endpoint.recv()
+        plugger.join()
+
+        if not devices:
+            raise RuntimeError("Device not found")
+        return found - plugged
+
+
+def run(runs=20, poll_interval=1.0, delay=0.05):
+    for use_inotify in (True, False):
+        for create_dir in (False, True):
+            latencies = np.array([run_case(use_inotify, create_dir, poll_interval, delay) for _ in range(runs)]) * 1000
+            mode = "inotify" if use_inotify else f"poll {poll_interval:.1f}s"
+            directory = "created on plug" if create_dir else "existing"
+            print(
+                f"[INFO] {mode:>9}, by-id {directory:>15}: detected after p50 {np.percentile(latencies, 50):.1f}ms, "
+                f"max {latencies.max():.1f}ms"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hotplug detection latency on a temporary /dev/serial/by-id stand-in")
+    parser.add_argument("-runs", type=int, default=20, help="Plug events per case")
+    parser.add_argument("-poll_interval", type=float, default=1.0, help="Polling interval, seconds")
+    parser.add_argument("-delay", type=float, default=0.05, help="Seconds from waiting to plugging")
+
+    args = parser.parse_args()
+
+    run(**vars(args))
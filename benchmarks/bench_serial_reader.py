@@ -0,0 +1,91 @@
+import argparse
+import os
+import sys
+import threading
+import time
+
+import serial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from util.serial_reader import SerialReader
+
+
+def feed_pty(master_fd, total_size, bytes_per_sec, chunk_size=4096):
+    # Writes test data to the pty master at the given rate
+    data = bytes(range(256)) * (chunk_size // 256)
+    start = time.monotonic()
+    sent = 0
+    while sent < total_size:
+        size = min(chunk_size, total_size - sent)
+        sent += os.write(master_fd, data[:size])
+        delay = start + sent / bytes_per_sec - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def legacy_read(ser, total_size):
+    # Original loop: timeout=0 and ser.read(1024) in a tight loop
+    received = 0
+    while received < total_size:
+        chunk = ser.read(1024)
+        received += len(chunk)
+    return received
+
+
+def reader_read(ser, total_size):
+    reader = SerialReader(ser)
+    received = 0
+    while received < total_size:
+        received += len(reader.read_chunk(timeout=1.0))
+    return received
+
+
+def run_case(name, read_func, total_size, bytes_per_sec):
+    master_fd, slave_fd = os.openpty()
+    ser = serial.Serial(os.ttyname(slave_fd), timeout=0)
+
+    writer = threading.Thread(target=feed_pty, args=(master_fd, total_size, bytes_per_sec), daemon=True)
+    result = {}
+
+    def reader_thread():
+        cpu_start = time.thread_time()
+        start = time.monotonic()
+        result["received"] = read_func(ser, total_size)
+        result["cpu"] = time.thread_time() - cpu_start
+        result["wall"] = time.monotonic() - start
+
+    thread = threading.Thread(target=reader_thread)
+    thread.start()
+    writer.start()
+    thread.join()
+    writer.join()
+
+    ser.close()
+    os.close(master_fd)
+    os.close(slave_fd)
+
+    mb = result["received"] / (1024 * 1024)
+    cpu_per_mb = result["cpu"] / mb
+    print(
+        f"[INFO] {name:>14}: {mb:.1f}MB in {result['wall']:.2f}s, CPU {result['cpu']:.2f}s, "
+        f"{cpu_per_mb * 1000:.1f}ms CPU per MB ({result['cpu'] / result['wall'] * 100:.0f}% of a core)"
+    )
+
+
+def run(size_mb=2.0, baudrate=4000000):
+    total_size = int(size_mb * 1024 * 1024)
+    bytes_per_sec = baudrate / 10  # 8N1
+    print(f"[INFO] Reading {size_mb}MB from pty at {baudrate} baud")
+    run_case("legacy", legacy_read, total_size, bytes_per_sec)
+    run_case("SerialReader", reader_read, total_size, bytes_per_sec)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serial reader CPU benchmark on a pty stand-in (POSIX only)")
+    parser.add_argument("-size_mb", type=float, default=2.0, help="Amount of data to transfer, MB")
+    parser.add_argument("-baudrate", type=int, default=4000000, help="Simulated link speed")
+
+    args = parser.parse_args()
+
+    run(**vars(args))
@@ -1,162 +1,459 @@
 import argparse
+import asyncio
 import os
 
 import cv2
 import numpy as np
-import serial
 import time
 
-from util.buffer_image import BufferImage
-from util.device import find_device_by_vid_pid
+from util.burst_buffer import BURST_LAST, BURST_NEXT, BurstBuffer
+from util.capture_pipeline import CapturePipeline, PipelineStage
+from util.capture_recording import CaptureReader, CaptureRecorder
+from util.device import find_device_by_vid_pid, open_device
+from util.disk_writer import DiskWriter
+from util.encoder import EncoderPool, encode_settings
+from util.frame import Frame
+from util.isp import isp
 from util.jpeg_stream_player import JpegStreamPlayer
-from util.raw_image import RawImage
-from util.snapshot_header import SnapshotFormat, SnapshotHeader
+from util.metrics import metrics
+from util.mjpeg_writer import MjpegWriter
+from util.multi_camera import MultiCameraCapture
+from util.recovery import RESCAN, RESYNC, Recovery
+from util.serial_reader import SerialReader
+from util.snapshot_protocol import PipelinedSnapshots, drain_steps, reset_steps, run_steps, snapshot_steps
+from util.transport import open_transport
 
-RESET_CMD = b"R"
-SNAPSHOT_CMD = b"S"
-TRANSFER_CMD = b"T"
+REPORT_INTERVAL = 10.0  # seconds
 
+READ_TIMEOUT = 1.0  # seconds without data
 
-def read_images_loop(com=None, format="jpeg", vflip=False, hflip=False):
+# Pause before reopening a failed transport, doubled per attempt
+REOPEN_BACKOFF = 0.25  # seconds
+MAX_BACKOFF = 4.0  # seconds
+
+
+def process_frame(frame, vflip=False, hflip=False, fast_preview=False):
+    snapshot_header, image_data, timestamp = frame
+
+    # Load frame, flips are applied on the raw Bayer image or as JPEG orientation
+    frame = Frame(snapshot_header, image_data, hflip=hflip, vflip=vflip, timestamp=timestamp, fast_preview=fast_preview)
+
+    # Decode JPEG or demosaic raw image for display
+    frame.preview
+
+    return frame
+
+
+def show_frame(player, frame, format="jpeg", writer=None, video=None, encoder=None):
+    # Record video, JPEG frames are passed through
+    if video:
+        video.write_frame(frame)
+
+    # Save image, raw image format applies to raw frames only
+    if player.save_next_frame:
+        format = format if not frame.is_jpeg() else "jpeg"
+        if encoder and writer:
+            encoder.save(frame, writer, format)
+        elif writer:
+            writer.write(frame.encoded(format), format)
+        else:
+            frame.save(format)
+
+    # Show image
+    player.show_next_frame(frame)
+
+
+def create_pipeline(
+    player, format="jpeg", vflip=False, hflip=False, workers=2, queue_depth=2, writer=None, video=None, fast_preview=False, encoder=None
+):
+    stages = [
+        PipelineStage("process", lambda frame: process_frame(frame, vflip, hflip, fast_preview), workers),
+        PipelineStage("show", lambda frame: show_frame(player, frame, format, writer, video, encoder)),
+    ]
+    pipeline = CapturePipeline(stages, queue_depth)
+    pipeline.start()
+    return pipeline
+
+
+def read_images_loop(
+    com=None,
+    format="jpeg",
+    vflip=False,
+    hflip=False,
+    pipeline=False,
+    workers=2,
+    queue_depth=2,
+    record=None,
+    burst=0,
+    burst_mode=BURST_NEXT,
+    inflight=0,
+    avi=None,
+    fast_preview=False,
+    encoders=1,
+    encoder_processes=False,
+):
     player = None
+    use_pipeline = pipeline
+    pipeline = None
+    last_report_time = time.monotonic()
+    deinterleavers = {}
+    writer = DiskWriter().start()
+    encoder = EncoderPool(encoders, encoder_processes) if encoders else None
+    video = MjpegWriter(avi) if avi else None
 
-    while True:
-        try:
-            if not com:
-                com = find_device_by_vid_pid()
+    # Record the payloads as received, raw images are not deinterleaved while recording
+    recorder = CaptureRecorder(record) if record else None
+    if recorder:
+        deinterleavers = None
+
+    # Burst frames are kept as received, encoded and saved after the burst
+    burst = BurstBuffer(burst) if burst else None
+    bursting = False
+    if burst is not None:
+        deinterleavers = None
 
+    # Errors are recovered on the open port first, then by reopening it, then by searching the device
+    recovery = Recovery()
+
+    try:
+        while True:
+            try:
                 if not com:
-                    print("[ERROR] No FrameCam device found")
-                    time.sleep(1)
-                    continue
-
-            print(f"[INFO] Opening serial port {com}...")
-            ser = serial.Serial(
-                port=com,
-                baudrate=460800,
-                bytesize=serial.EIGHTBITS,
-                parity=serial.PARITY_NONE,
-                stopbits=serial.STOPBITS_ONE,
-                timeout=1.0,  # 1 sec
-            )
+                    com = find_device_by_vid_pid()
 
-            # Start video player
-            if not player:
-                player = JpegStreamPlayer()
-                player.start()
-
-            # Send reset command
-            ser.write(RESET_CMD)
-            print(f"[INFO] Sent '{RESET_CMD.decode()}' to device, waiting for reset data...")
-
-            # Wait for 1 sec
-            time.sleep(1)
-
-            # Read data loop
-            buffer = bytearray()
-            while True:
-                # Send snapshot command
-                ser.write(SNAPSHOT_CMD)
-                print(f"[INFO] Sent '{SNAPSHOT_CMD.decode()}' to device, waiting for snapshot to be done...")
-
-                # Read snapshot header (20 bytes)
-                header_data = ser.read(20)
-                if not header_data:
-                    print("[ERROR] Could not read snapshot header")
-                    time.sleep(1)
-                    continue
+                    if not com:
+                        print("[ERROR] No FrameCam device found")
+                        time.sleep(1)
+                        continue
 
-                # Parse snapshot
-                snapshot_header = SnapshotHeader(header_data)
-                if not snapshot_header.valid():
-                    print("[ERROR] Invalid snapshot header")
-                    time.sleep(1)
-                    continue
+                print(f"[INFO] Opening serial port {com}...")
+                ser = open_device(com, timeout=1.0)  # 1 sec
+                reader = SerialReader(ser)
+
+                # Start video player
+                if not player:
+                    player = JpegStreamPlayer()
+                    player.start()
+
+                # Start processing pipeline
+                if use_pipeline and not pipeline:
+                    pipeline = create_pipeline(player, format, vflip, hflip, workers, queue_depth, writer, video, fast_preview, encoder)
+
+                # Reset device
+                run_steps(reset_steps(), ser, reader, READ_TIMEOUT)
+
+                # Keep snapshot requests in flight while frames are processed
+                snapshots = PipelinedSnapshots(inflight) if inflight else None
+
+                # Read data loop
+                buffer = bytearray()
+                while True:
+                    start_time = time.monotonic()
+                    if snapshots:
+                        steps = snapshots.snapshot_steps(deinterleavers, reuse_output=not pipeline)
+                    else:
+                        steps = snapshot_steps(deinterleavers, reuse_output=not pipeline)
+                    frame = run_steps(steps, ser, reader, READ_TIMEOUT)
+                    if frame is None:
+                        if recovery.failed() != RESYNC:
+                            break  # reopen the port or search the device
+                        recovery.resync(ser, reader)
+                        if snapshots:
+                            snapshots.outstanding = 0
+                        continue
+                    recovery.succeeded()
+                    frame = (*frame, time.time())
+
+                    if recorder:
+                        recorder.write(*frame)
+
+                    if burst is not None:
+                        if bursting or burst_mode == BURST_LAST:
+                            burst.add(*frame)
+
+                        # Burst key pressed
+                        if player.burst_requested:
+                            player.burst_requested = False
+                            if burst_mode == BURST_LAST:
+                                burst.flush(writer, format, vflip, hflip, encoder=encoder)
+                            else:
+                                print(f"[INFO] Capturing burst of {burst.size} frames...")
+                                burst.clear()
+                                bursting = True
 
-                # Start image transfer
-                ser.write(TRANSFER_CMD)
-                print(f"[INFO] Sent '{TRANSFER_CMD.decode()}' to device, waiting for image...")
+                        # No processing while a burst is captured
+                        if bursting:
+                            if burst.full():
+                                burst.flush(writer, format, vflip, hflip, encoder=encoder)
+                                bursting = False
+                            continue
 
-                # Read image
-                start_time = time.time()
-                image_data = ser.read(snapshot_header.image_size)
-                if not image_data:
-                    print("[ERROR] Could not read image")
+                    if pipeline:
+                        pipeline.submit(frame, read_time=time.monotonic() - start_time)
+
+                        # Print stage report
+                        if time.monotonic() - last_report_time > REPORT_INTERVAL:
+                            print(pipeline.report())
+                            last_report_time = time.monotonic()
+                    else:
+                        show_frame(player, process_frame(frame, vflip, hflip, fast_preview), format, writer, video, encoder)
+
+                    # Check for video to be closed
+                    if not player.running:
+                        print("[INFO] Video closed by user. Exiting...")
+                        return
+
+            except KeyboardInterrupt:
+                print("[INFO] Exiting...")
+                return
+            except Exception as e:
+                print(f"[ERROR] {e}")
+                if recovery.failed(disconnected=True) == RESCAN:
+                    print("[INFO] Searching device in 1 second...")
                     time.sleep(1)
-                    continue
-
-                # Calculate transmission time
-                end_time = time.time()
-                kb = len(image_data) / 1024
-                mbps = len(image_data) * 8 / ((end_time - start_time) * 1024 * 1024)
-                print(f"[INFO] Transfer done, {kb:.1f}kb, speed: {mbps:.2f}mbit/s")
-
-                # Read image
-                if snapshot_header.format == SnapshotFormat.JPEG:
-                    # Direct load JPEG
-                    buffer_image = BufferImage(image_data)
-                else:
-                    # Load raw image
-                    raw_image = RawImage(
-                        image_data,
-                        snapshot_header.format,
-                        snapshot_header.width,
-                        snapshot_header.height,
-                        snapshot_header.interleaving if snapshot_header.interleaving > 0 else None,
-                    )
-
-                    # Convert to image
-                    if format == "jpeg":
-                        image_data = raw_image.to_jpeg()
-                    elif format == "png":
-                        image_data = raw_image.to_png()
-
-                    # Load to buffer image
-                    buffer_image = BufferImage(image_data)
-
-                # Flip image
-                if hflip or vflip:
-                    buffer_image.flip(hflip, vflip)
-
-                # Save image
-                if player.save_next_frame:
-                    buffer_image.save(format)
-
-                # Show image
-                player.show_next_frame(image_data, snapshot_header)
-
-                # Check for video to be closed
+            finally:
+                try:
+                    if "ser" in locals() and ser.is_open:
+                        ser.close()
+                        buffer.clear()
+                        print(f"[INFO] Serial port {com} closed.")
+                except Exception as e:
+                    print(f"[WARN] Could not close serial port cleanly: {e}")
+                if recovery.tier == RESCAN:
+                    com = None  # Re-trigger device search on next loop
+
+                # if player:
+                #     player.stop()
+
+    finally:
+        if pipeline:
+            pipeline.stop()
+            print(pipeline.report())
+        if encoder:
+            encoder.stop()
+            print(encoder.report())
+        writer.stop()
+        print(writer.report())
+        if recorder:
+            recorder.close()
+        if video:
+            video.close()
+        print(recovery.report())
+
+
+def replay_images(
+    path,
+    format="jpeg",
+    vflip=False,
+    hflip=False,
+    workers=2,
+    queue_depth=2,
+    avi=None,
+    fast_preview=False,
+    encoders=1,
+    encoder_processes=False,
+):
+    # Drives the processing pipeline from a recording at full speed
+    player = JpegStreamPlayer()
+    player.start()
+    writer = DiskWriter().start()
+    encoder = EncoderPool(encoders, encoder_processes) if encoders else None
+    video = MjpegWriter(avi) if avi else None
+    pipeline = create_pipeline(player, format, vflip, hflip, workers, queue_depth, writer, video, fast_preview, encoder)
+
+    start_time = time.monotonic()
+    try:
+        with CaptureReader(path) as recording:
+            print(f"[INFO] Replaying {len(recording)} frames from {path}...")
+            for frame in recording:
+                pipeline.submit((frame.header, frame.payload, frame.timestamp))
                 if not player.running:
-                    print("[INFO] Video closed by user. Exiting...")
-                    return
+                    break
+    except KeyboardInterrupt:
+        print("[INFO] Exiting...")
+    finally:
+        pipeline.stop()
+        print(pipeline.report())
+        if encoder:
+            encoder.stop()
+            print(encoder.report())
+        writer.stop()
+        print(writer.report())
+        if video:
+            video.close()
+        print(f"[INFO] Replay done in {time.monotonic() - start_time:.2f}s")
+        player.stop()
 
-        except KeyboardInterrupt:
-            print("[INFO] Exiting...")
-            return
+
+async def read_images_async(
+    url, format="jpeg", vflip=False, hflip=False, queue_depth=2, avi=None, fast_preview=False, encoders=1, encoder_processes=False
+):
+    # Capture, processing and saving driven by one event loop, codec work runs in the default executor
+    loop = asyncio.get_running_loop()
+    player = JpegStreamPlayer()
+    player.start()
+    writer = DiskWriter().start()
+    encoder = EncoderPool(encoders, encoder_processes) if encoders else None
+    video = MjpegWriter(avi) if avi else None
+
+    in_flight = asyncio.Semaphore(queue_depth)
+    tasks = set()
+
+    async def handle_frame(frame):
+        try:
+            frame = await loop.run_in_executor(None, process_frame, frame, vflip, hflip, fast_preview)
+            await loop.run_in_executor(None, show_frame, player, frame, format, writer, video, encoder)
         except Exception as e:
-            print(f"[ERROR] {e}. Restarting in 1 second...")
-            time.sleep(1)
+            print(f"[ERROR] Could not process frame: {e}")
         finally:
+            in_flight.release()
+
+    # Errors are recovered on the open transport first, then by reopening it after a growing pause
+    recovery = Recovery()
+    end_of_stream = False
+
+    try:
+        while player.running and not end_of_stream:
             try:
-                if "ser" in locals() and ser.is_open:
-                    ser.close()
-                    buffer.clear()
-                    print(f"[INFO] Serial port {com} closed.")
+                print(f"[INFO] Opening transport {url}...")
+                async with open_transport(url) as transport:
+                    await transport.run(reset_steps(), READ_TIMEOUT)
+
+                    while player.running:
+                        frame = await transport.run(snapshot_steps(), READ_TIMEOUT)
+                        if frame is None:
+                            if transport.eof:
+                                print("[INFO] End of stream")
+                                end_of_stream = True
+                                break
+                            if recovery.failed() != RESYNC:
+                                break  # reopen the transport
+                            transport.pending = b""
+                            await transport.run(drain_steps(), READ_TIMEOUT)
+                            continue
+                        recovery.succeeded()
+                        frame = (*frame, time.time())
+
+                        # Process frame while the next one is captured
+                        await in_flight.acquire()
+                        task = loop.create_task(handle_frame(frame))
+                        tasks.add(task)
+                        task.add_done_callback(tasks.discard)
             except Exception as e:
-                print(f"[WARN] Could not close serial port cleanly: {e}")
-            com = None  # Re-trigger device search on next loop
+                print(f"[ERROR] {e}")
+                recovery.failed(disconnected=True)
+
+            if player.running and not end_of_stream:
+                backoff = min(REOPEN_BACKOFF * 2 ** (recovery.tier_attempts - 1), MAX_BACKOFF)
+                print(f"[INFO] Reopening transport in {backoff:.1f}s...")
+                await asyncio.sleep(backoff)
 
-            # if player:
-            #     player.stop()
+        if not player.running:
+            print("[INFO] Video closed by user. Exiting...")
+    finally:
+        await asyncio.gather(*tasks)
+        if encoder:
+            await loop.run_in_executor(None, encoder.stop)
+            print(encoder.report())
+        await loop.run_in_executor(None, writer.stop)
+        print(writer.report())
+        if video:
+            video.close()
+        print(recovery.report())
+        player.stop()
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="FrameCam USB image reader")
     parser.add_argument("-com", metavar="PORT", help="Specify COM port (e.g., COM3)")
-    parser.add_argument("-format", metavar="FORMAT", default="jpeg", help="Raw image save format")
+    parser.add_argument("-format", metavar="FORMAT", default="jpeg", help="Raw image save format: jpeg, png or bayer (lossless mosaic)")
     parser.add_argument("-vflip", action="store_true", help="Horizontal flip")
     parser.add_argument("-hflip", action="store_true", help="Vertical flip")
+    parser.add_argument("-pipeline", action="store_true", help="Process frames on worker threads while reading the next one")
+    parser.add_argument("-workers", metavar="N", type=int, default=2, help="Number of processing workers in pipeline mode")
+    parser.add_argument("-queue_depth", metavar="N", type=int, default=2, help="Depth of the pipeline queues")
+    parser.add_argument("-multi", action="store_true", help="Capture and save all frames from all connected cameras")
+    parser.add_argument("-url", metavar="URL", help="Capture with asyncio from a port or URL (socket://host:port, loop://, file://path)")
+    parser.add_argument("-record", metavar="FILE", help="Record received snapshots to a capture recording")
+    parser.add_argument("-replay", metavar="FILE", help="Process the snapshots of a capture recording at full speed")
+    parser.add_argument("-burst", metavar="N", type=int, default=0, help="Save a burst of N frames on key 'b'")
+    parser.add_argument("-burst_mode", choices=[BURST_NEXT, BURST_LAST], default=BURST_NEXT, help="Burst of the next or the last N frames")
+    parser.add_argument("-inflight", metavar="N", type=int, default=0, help="Snapshot requests in flight while a frame is processed")
+    parser.add_argument("-avi", metavar="FILE", help="Record video to an MJPEG AVI, JPEG frames are not re-encoded")
+    parser.add_argument("-fast_preview", action="store_true", help="Preview raw frames at half resolution, full demosaic for saved frames")
+    parser.add_argument("-isp", action="store_true", help="Auto white balance and gamma for raw frames")
+    parser.add_argument("-encoders", metavar="N", type=int, default=1, help="Encoder workers for saved frames, 0 to encode inline")
+    parser.add_argument("-encoder_processes", action="store_true", help="Encode in worker processes instead of threads")
+    parser.add_argument("-jpeg_quality", metavar="Q", type=int, help="JPEG quality of encoded frames, 0-100 (default 95)")
+    parser.add_argument("-jpeg_optimize", action="store_true", help="Optimized JPEG Huffman tables, smaller files, slower encoding")
+    parser.add_argument("-png_compression", metavar="LEVEL", type=int, help="PNG compression level, 0-9 (default 1)")
+    parser.add_argument("-metrics", action="store_true", help="Time capture stages, show them in the video and report on exit")
+    parser.add_argument("-metrics_json", metavar="FILE", help="Append stage timings to a JSON lines file every second")
+    parser.add_argument("-metrics_port", metavar="PORT", type=int, help="Serve stage timings for Prometheus on localhost")
 
     args = parser.parse_args()
 
-    read_images_loop(**vars(args))
+    # Stage timing metrics
+    if args.metrics or args.metrics_json or args.metrics_port:
+        metrics.enable()
+        if args.metrics_json:
+            metrics.export_json_lines(args.metrics_json)
+        if args.metrics_port:
+            metrics.serve_prometheus(args.metrics_port)
+
+    # Colour processing of raw frames
+    isp.enable(args.isp)
+
+    # Encoding of saved frames, camera JPEGs are saved as received
+    encode_settings.update(args.jpeg_quality, args.jpeg_optimize, args.png_compression)
+
+    if args.multi:
+        ports = [args.com] if args.com else None
+        MultiCameraCapture(
+            ports,
+            args.format,
+            args.vflip,
+            args.hflip,
+            args.encoders,
+            args.encoder_processes,
+            queue_depth=args.queue_depth,
+            save_workers=args.workers,
+        ).run()
+    elif args.replay:
+        replay_images(
+            args.replay,
+            args.format,
+            args.vflip,
+            args.hflip,
+            args.workers,
+            args.queue_depth,
+            args.avi,
+            args.fast_preview,
+            args.encoders,
+            args.encoder_processes,
+        )
+    elif args.url:
+        try:
+            asyncio.run(
+                read_images_async(
+                    args.url,
+                    args.format,
+                    args.vflip,
+                    args.hflip,
+                    args.queue_depth,
+                    args.avi,
+                    args.fast_preview,
+                    args.encoders,
+                    args.encoder_processes,
+                )
+            )
+        except KeyboardInterrupt:
+            print("[INFO] Exiting...")
+    else:
+        del args.url, args.multi, args.replay, args.metrics, args.metrics_json, args.metrics_port, args.isp
+        del args.jpeg_quality, args.jpeg_optimize, args.png_compression
+        read_images_loop(**vars(args))
+
+    if metrics.enabled:
+        print(metrics.report())
+        metrics.stop()
@@ -4,8 +4,12 @@ import os
 import sys
 import time
 
+from util.serial_reader import SerialReader
+
 JPEG_EOF = b"\xff\xd9"  # JPEG end-of-file marker
 
+READ_TIMEOUT = 5.0  # wait for data at most, seconds
+
 OUTPUT_DIR = "DCIM"
 
 
@@ -65,9 +69,10 @@ def read_image(com_port=None):
         print("[INFO] Sent 'T' to device, waiting for image...")
 
         # Read data until JPEG EOF marker
+        reader = SerialReader(ser)
         buffer = bytearray()
         while True:
-            chunk = ser.read(1024)
+            chunk = reader.read_chunk(READ_TIMEOUT)
             if not chunk:
                 print("[ERROR] Timeout or no data received.")
                 break
@@ -1,23 +1,32 @@
 import argparse
-import os
 
-import cv2
-import numpy as np
 import serial
-import serial.tools.list_ports
 import time
 
+from util.buffer_image import BufferImage
+from util.device import find_device_by_vid_pid
+from util.disk_writer import DiskWriter
+from util.frame import Frame
+from util.isp import isp
+from util.jpeg_framer import JpegFramer
 from util.jpeg_stream_player import JpegStreamPlayer
+from util.mjpeg_writer import MjpegWriter
+from util.raw_framer import RawFramer
 from util.raw_image import RawImage
+from util.recovery import RESCAN, RESYNC, Recovery
+from util.serial_reader import SerialReader
+from util.snapshot_header import SnapshotFormat
 
 VIDS = [0x1A86, 12619]
 PIDS = [0xFE01]
 
-JPEG_SOI = b"\xff\xd8"  # JPEG start-of-image marker
-JPEG_EOF = b"\xff\xd9"  # JPEG end-of-file marker
+RAW_TIMEOUT = 1.0  # 1 second, fallback if the transfer stops before the expected size
+FRAME_TIMEOUT = 2.0  # seconds without data while a frame is requested, then recover
 
-RAW_TIMEOUT = 1.0  # 1 second
+READ_TIMEOUT = 0.1  # wait for data at most, seconds
+READ_BUFFER_SIZE = 256 * 1024
 
+RAW_FORMAT = SnapshotFormat.RAW_GRBG8
 RAW_WIDTH = 1920
 RAW_HEIGHT = 1080
 RAW_INTERLEAVING = 8
@@ -25,44 +34,74 @@ RAW_INTERLEAVING = 8
 OUTPUT_DIR = "DCIM"
 
 
-def find_device_by_vid_pid(target_vids, target_pids):
-    while True:
-        ports = serial.tools.list_ports.comports()
-        for port in ports:
-            if port.vid in target_vids and port.pid in target_pids:
-                print(f"[INFO] Found device: {port.device}")
-                return port.device
-        print("[WAIT] Waiting for USB device to be connected...")
-        time.sleep(1)  # Wait before retrying
-
-
-def save_image(buffer, format="jpeg"):
-    # Create output directory if it doesn't exist
-    if not os.path.exists(OUTPUT_DIR):
-        os.makedirs(OUTPUT_DIR)
-
-    # Select file extension
-    if format == "jpeg":
-        ext = "jpg"
+def save_image(buffer, format="jpeg", writer=None):
+    # Save in the background if there is a writer
+    if writer:
+        writer.write(buffer, format)
+    else:
+        BufferImage(buffer, OUTPUT_DIR).save(format)
+
+
+def process_raw_image(
+    snapshot_header,
+    image_data,
+    player,
+    video=False,
+    format="jpeg",
+    vflip=False,
+    hflip=False,
+    writer=None,
+    video_writer=None,
+    fast_preview=False,
+):
+    # Debug save raw buffer
+    # with open("DCIM/image.raw", "wb") as f:
+    #     f.write(image_data)
+
+    # Load image, geometry from snapshot header if the device sent one
+    if snapshot_header is not None:
+        interleaving = snapshot_header.interleaving if snapshot_header.interleaving > 0 else None
+        raw_image = RawImage(image_data, snapshot_header.format, snapshot_header.width, snapshot_header.height, interleaving)
     else:
-        ext = format
+        raw_image = RawImage(image_data, RAW_FORMAT, width=RAW_WIDTH, height=RAW_HEIGHT, interleaving=RAW_INTERLEAVING)
+    if hflip:
+        raw_image = raw_image.horizontal_flip()
+    if vflip:
+        raw_image = raw_image.vertical_flip()
+
+    if format not in ("jpeg", "png", "bayer"):
+        print("[ERROR] Unsupported image format")
+        return False
 
-    # filename format is "FrameCam_YYYYMMDD_HHMMSS.EXT"
-    current_time = time.strftime("%Y%m%d_%H%M%S")
-    filename = f"{OUTPUT_DIR}/FrameCam_{current_time}.{ext}"
+    # Process image, demosaiced once for both saving and display
+    frame = Frame(snapshot_header, raw_image=raw_image, fast_preview=fast_preview)
+    if not video or player.save_next_frame:
+        save_image(frame.encoded(format), format, writer)
 
-    with open(filename, "wb") as f:
-        f.write(buffer)
+    if video:
+        player.show_next_frame(frame)
 
-    print(f"[INFO] Image saved as {filename}")
+    # Record video, encoded once
+    if video_writer:
+        video_writer.write_frame(frame)
 
+    return True
 
-def read_images_loop(com=None, video=False, single=False, raw=False, format="jpeg", vflip=False, hflip=False, fast_mode=False):
+
+def read_images_loop(
+    com=None, video=False, single=False, raw=False, format="jpeg", vflip=False, hflip=False, fast_mode=False, avi=None, fast_preview=False
+):
     if fast_mode:
         cmd = b"X"
     else:
         cmd = b"S"
 
+    player = None
+    writer = DiskWriter(OUTPUT_DIR).start()
+    video_writer = MjpegWriter(avi) if avi else None
+
+    # Errors are recovered on the open port first, then by reopening it, then by searching the device
+    recovery = Recovery()
     while True:
         try:
             if not com:
@@ -82,68 +121,63 @@ def read_images_loop(com=None, video=False, single=False, raw=False, format="jpe
                 stopbits=serial.STOPBITS_ONE,
                 timeout=0,  # no read timeout
             )
+            reader = SerialReader(ser, buffer_size=READ_BUFFER_SIZE)
 
             if video:
                 player = JpegStreamPlayer()
                 player.start()
 
+            request_time = None
             if video or single:
                 # Send cmd character to request the first frame
                 ser.write(cmd)
+                request_time = time.time()
                 print(f"[INFO] Sent '{cmd.decode()}' to device, waiting for snapshot to be done...")
 
-            buffer = bytearray()
+            raw_framer = RawFramer(RAW_WIDTH * RAW_HEIGHT)
+            framer = JpegFramer()
             start_time = None
             last_read_time = None
             while True:
-                chunk = ser.read(1024)
+                chunk = reader.read_chunk(READ_TIMEOUT)
                 if not chunk:
-                    if raw and len(buffer) > 0 and last_read_time is not None and (time.time() - last_read_time) > RAW_TIMEOUT:
-                        # Raw image ready by timeout
-                        print(f"[INFO] Raw image ready by timeout ({len(buffer)} bytes)")
-
-                        end_time = time.time()
-                        mbps = len(buffer) * 8 / ((end_time - start_time) * 1024 * 1024)
-                        print(f"[INFO] Transmission speed: {mbps:.2f}mbit/s")
-
-                        # Debug save raw buffer
-                        # with open("DCIM/image.raw", "wb") as f:
-                        #     f.write(buffer)
-
-                        # Load image
-                        raw_image = RawImage(buffer, width=RAW_WIDTH, height=RAW_HEIGHT, interleaving=RAW_INTERLEAVING)
-                        if hflip:
-                            raw_image = raw_image.horizontal_flip()
-                        if vflip:
-                            raw_image = raw_image.vertical_flip()
-
-                        # Convert to image
-                        if format == "jpeg":
-                            image_data = raw_image.to_jpeg()
-                        elif format == "png":
-                            image_data = raw_image.to_png()
-                        else:
-                            print("[ERROR] Unsupported image format")
+                    if raw and raw_framer.pending() > 0 and last_read_time is not None and (time.time() - last_read_time) > RAW_TIMEOUT:
+                        # Fallback: transfer stopped before the expected size
+                        snapshot_header, image_data = raw_framer.flush()
+                        print(f"[WARN] Raw image incomplete, ready by timeout ({len(image_data)} bytes)")
+
+                        if not process_raw_image(
+                            snapshot_header, image_data, player, video, format, vflip, hflip, writer, video_writer, fast_preview
+                        ):
                             return
+                        recovery.succeeded()
 
-                        # Process image
-                        if not video or player.save_next_frame:
-                            save_image(image_data, format)
-
-                        if video:
-                            player.show_next_frame(image_data)
-
-                        buffer.clear()
                         start_time = None
                         last_read_time = None
 
                         if video:
                             # Send cmd character to request the next frame
                             ser.write(cmd)
+                            request_time = time.time()
                             print(f"[INFO] Sent '{cmd.decode()}' to device, waiting for snapshot to be done...")
                         elif single:
                             return
 
+                    elif request_time is not None and time.time() - max(request_time, last_read_time or 0) > FRAME_TIMEOUT:
+                        # No frame for the request
+                        if recovery.failed() != RESYNC:
+                            break  # reopen the port or search the device
+                        recovery.resync(ser, reader)
+                        framer.reset()
+                        raw_framer.reset()
+                        start_time = None
+                        last_read_time = None
+
+                        # Request the frame again
+                        ser.write(cmd)
+                        request_time = time.time()
+                        print(f"[INFO] Sent '{cmd.decode()}' to device, waiting for snapshot to be done...")
+
                     continue
 
                 last_read_time = time.time()
@@ -153,46 +187,63 @@ def read_images_loop(com=None, video=False, single=False, raw=False, format="jpe
 
                 # print(f"[INFO] Received {len(chunk)} bytes, buffer size: {len(buffer)}.")
 
-                buffer.extend(chunk)
-
                 if raw:
-                    continue
-
-                eof_pos = buffer.find(JPEG_EOF)
-                if eof_pos != -1:
-                    print("[INFO] JPEG EOF detected")
+                    # Raw image is ready as soon as the expected size arrives
+                    for snapshot_header, image_data in raw_framer.feed(chunk):
+                        print(f"[INFO] Raw image received ({len(image_data)} bytes)")
 
-                    soi_pos = buffer.find(JPEG_SOI)
-                    if soi_pos != -1:
                         end_time = time.time()
-                        mbps = len(buffer) * 8 / ((end_time - start_time) * 1024 * 1024)
+                        mbps = len(image_data) * 8 / ((end_time - start_time) * 1024 * 1024)
                         print(f"[INFO] Transmission speed: {mbps:.2f}mbit/s")
 
-                        image_data = buffer[soi_pos : eof_pos + 2]
-
-                        # Flip image
-                        if hflip or vflip:
-                            image_array = cv2.imdecode(np.frombuffer(image_data, dtype=np.uint8), cv2.IMREAD_COLOR)
-                            if image_array is not None:
-                                if hflip:
-                                    image_array = cv2.flip(image_array, 1)
-                                if vflip:
-                                    image_array = cv2.flip(image_array, 0)
-                                _, encoded_image = cv2.imencode('.jpg', image_array)
-                                image_data = encoded_image.tobytes()
+                        if not process_raw_image(
+                            snapshot_header, image_data, player, video, format, vflip, hflip, writer, video_writer, fast_preview
+                        ):
+                            return
+                        recovery.succeeded()
 
-                        # Process image
-                        if not video or player.save_next_frame:
-                            save_image(image_data)
+                        last_read_time = None
 
                         if video:
-                            player.show_next_frame(image_data)
-                    else:
-                        print("[WARN] JPEG SOI not found. Skipping image...")
+                            # Check for video to be closed
+                            if not player.running:
+                                print("[INFO] Video closed by user. Exiting...")
+                                return
+
+                            # Send cmd character to request the next frame
+                            ser.write(cmd)
+                            request_time = time.time()
+                            print(f"[INFO] Sent '{cmd.decode()}' to device, waiting for snapshot to be done...")
+                        elif single:
+                            return
+
+                    if last_read_time is None:
+                        start_time = None
+                    continue
 
-                    buffer = buffer[eof_pos + 2 :]
+                # Frame JPEG stream incrementally
+                for image_data in framer.feed(chunk):
+                    print("[INFO] JPEG EOF detected")
+
+                    end_time = time.time()
+                    mbps = len(image_data) * 8 / ((end_time - start_time) * 1024 * 1024)
+                    print(f"[INFO] Transmission speed: {mbps:.2f}mbit/s")
+
+                    # Flip image (lossless, EXIF orientation)
+                    frame = Frame(data=image_data, hflip=hflip, vflip=vflip)
+
+                    # Process image
+                    if not video or player.save_next_frame:
+                        save_image(frame.encoded(), writer=writer)
+
+                    if video:
+                        player.show_next_frame(frame)
+
+                    # Record video, JPEG is passed through
+                    if video_writer:
+                        video_writer.write_frame(frame)
+                    recovery.succeeded()
 
-                    start_time = None
                     last_read_time = None
 
                     if video:
@@ -203,29 +254,43 @@ def read_images_loop(com=None, video=False, single=False, raw=False, format="jpe
 
                         # Send cmd character to request the next frame
                         ser.write(cmd)
+                        request_time = time.time()
                         print(f"[INFO] Sent '{cmd.decode()}' to device, waiting for snapshot to be done...")
                     elif single:
                         return
 
+                if last_read_time is None:
+                    start_time = None
+
         except KeyboardInterrupt:
             print("[INFO] Exiting...")
             return
         except Exception as e:
-            print(f"[ERROR] {e}. Restarting in 1 second...")
-            time.sleep(1)
+            print(f"[ERROR] {e}")
+            if recovery.failed(disconnected=True) == RESCAN:
+                print("[INFO] Searching device in 1 second...")
+                time.sleep(1)
         finally:
             try:
                 if "ser" in locals() and ser.is_open:
                     ser.close()
-                    buffer.clear()
                     print(f"[INFO] Serial port {com} closed.")
             except Exception as e:
                 print(f"[WARN] Could not close serial port cleanly: {e}")
-            com = None  # Re-trigger device search on next loop
+            if recovery.tier == RESCAN:
+                com = None  # Re-trigger device search on next loop
+
+            # Write out queued images
+            writer.flush()
+            if video_writer:
+                video_writer.close()
 
             if video:
                 player.stop()
 
+            if any(recovery.counts.values()):
+                print(recovery.report())
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="FrameCam USB image reader")
@@ -233,11 +298,18 @@ if __name__ == "__main__":
     parser.add_argument("-video", action="store_true", help="Play video stream")
     parser.add_argument("-single", action="store_true", help="Read single image")
     parser.add_argument("-raw", action="store_true", help="Read raw image")
-    parser.add_argument("-format", metavar="FORMAT", default="jpeg", help="Raw image save format")
+    parser.add_argument("-format", metavar="FORMAT", default="jpeg", help="Raw image save format: jpeg, png or bayer (lossless mosaic)")
     parser.add_argument("-fast_mode", action="store_true", help="Use fast mode")
     parser.add_argument("-vflip", action="store_true", help="Horizontal flip")
     parser.add_argument("-hflip", action="store_true", help="Vertical flip")
+    parser.add_argument("-avi", metavar="FILE", help="Record video to an MJPEG AVI, JPEG frames are not re-encoded")
+    parser.add_argument("-fast_preview", action="store_true", help="Preview raw frames at half resolution, full demosaic for saved frames")
+    parser.add_argument("-isp", action="store_true", help="Auto white balance and gamma for raw frames")
 
     args = parser.parse_args()
 
+    # Colour processing of raw frames
+    isp.enable(args.isp)
+    del args.isp
+
     read_images_loop(**vars(args))
@@ -0,0 +1,38 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from util.burst_buffer import BurstBuffer
+from util.snapshot_header import SnapshotFormat, SnapshotHeader
+
+
+def jpeg_frame(size, fill):
+    header = SnapshotHeader(SnapshotHeader.pack(SnapshotFormat.JPEG, 640, 480, 0, size))
+    return header, bytes([fill]) * size
+
+
+def test_larger_payload_keeps_held_frames():
+    burst = BurstBuffer(4)
+    burst.add(*jpeg_frame(1000, 1), timestamp=1.0)
+    burst.add(*jpeg_frame(900, 2), timestamp=2.0)
+
+    # Larger than the slots with headroom, the ring grows
+    burst.add(*jpeg_frame(5000, 3), timestamp=3.0)
+
+    frames = list(burst.frames())
+    assert [timestamp for timestamp, _, _ in frames] == [1.0, 2.0, 3.0]
+    for (_, header, payload), fill in zip(frames, (1, 2, 3)):
+        assert len(payload) == header.image_size
+        assert bytes(payload) == bytes([fill]) * header.image_size
+
+
+def test_ring_keeps_last_frames_after_growing():
+    burst = BurstBuffer(3)
+    for i in range(5):
+        burst.add(*jpeg_frame(100 * (i + 1) ** 2, i), timestamp=float(i))
+
+    assert burst.full()
+    assert [(timestamp, bytes(payload)) for timestamp, _, payload in burst.frames()] == [
+        (float(i), bytes([i]) * 100 * (i + 1) ** 2) for i in (2, 3, 4)
+    ]
@@ -0,0 +1,97 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from util.device_watcher import DeviceWatcher, Inotify
+
+VID = 0x1209
+PID = 0x0001
+
+
+def fake_ids(device):
+    # Test device nodes are named after their VID/PID
+    name = os.path.basename(device)
+    if not name.startswith("tty"):
+        return None
+    vid, pid = name[3:].split("_")
+    return int(vid, 16), int(pid, 16)
+
+
+def plug(root, watch_dir, vid=VID, pid=PID):
+    # Creates a device node and its link in the watched directory, as udev does
+    device = os.path.join(root, f"tty{vid:04x}_{pid:04x}")
+    open(device, "w").close()
+    os.makedirs(watch_dir, exist_ok=True)
+    os.symlink(device, os.path.join(watch_dir, f"usb-{vid:04x}_{pid:04x}-if00"))
+    return device
+
+
+def plug_later(delay, *args):
+    timer = threading.Timer(delay, plug, args)
+    timer.start()
+    return timer
+
+
+def inotify_available():
+    try:
+        Inotify().close()
+    except (OSError, AttributeError):
+        return False
+    return True
+
+
+def test_lists_matching_devices_only(tmp_path):
+    watch_dir = tmp_path / "by-id"
+    plug(tmp_path, watch_dir, 0x0403, 0x6001)
+    device = plug(tmp_path, watch_dir)
+    with DeviceWatcher([VID], [PID], str(watch_dir), lookup=fake_ids) as watcher:
+        assert watcher.devices() == [os.path.realpath(device)]
+
+
+@pytest.mark.skipif(not inotify_available(), reason="inotify not available")
+@pytest.mark.parametrize("create_dir", [False, True])
+def test_inotify_returns_plugged_device(tmp_path, create_dir):
+    # The poll interval is far longer than the test, only an inotify event can wake the watcher
+    watch_dir = tmp_path / "serial" / "by-id"
+    if not create_dir:
+        watch_dir.mkdir(parents=True)
+    with DeviceWatcher([VID], [PID], str(watch_dir), poll_interval=60, lookup=fake_ids) as watcher:
+        timer = plug_later(0.2, tmp_path, watch_dir)
+        start = time.monotonic()
+        devices = watcher.wait(timeout=10)
+        timer.join()
+    assert devices == [os.path.realpath(tmp_path / f"tty{VID:04x}_{PID:04x}")]
+    assert time.monotonic() - start < 5
+
+
+@pytest.mark.skipif(not inotify_available(), reason="inotify not available")
+def test_inotify_watches_recreated_directory(tmp_path):
+    watch_dir = tmp_path / "serial" / "by-id"
+    watch_dir.mkdir(parents=True)
+    with DeviceWatcher([VID], [PID], str(watch_dir), poll_interval=60, lookup=fake_ids) as watcher:
+        assert watcher.wait(timeout=0.1) == []
+
+        # Link directory removed with the last device, created again for the next one
+        watch_dir.rmdir()
+        assert watcher.wait(timeout=0.1) == []
+        timer = plug_later(0.2, tmp_path, watch_dir)
+        devices = watcher.wait(timeout=10)
+        timer.join()
+    assert devices == [os.path.realpath(tmp_path / f"tty{VID:04x}_{PID:04x}")]
+
+
+def test_polling_returns_plugged_device(tmp_path):
+    watch_dir = tmp_path / "by-id"
+    watch_dir.mkdir()
+    with DeviceWatcher([VID], [PID], str(watch_dir), poll_interval=0.05, lookup=fake_ids, use_inotify=False) as watcher:
+        assert watcher.wait(timeout=0.1) == []
+        timer = plug_later(0.2, tmp_path, watch_dir)
+        devices = watcher.wait(timeout=10)
+        timer.join()
+        assert watcher.inotify is None
+    assert devices == [os.path.realpath(tmp_path / f"tty{VID:04x}_{PID:04x}")]
@@ -0,0 +1,47 @@
+import os
+import sys
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from util.focus_calc import FOCUS_METRICS, FocusEngine, center_roi
+
+
+def make_image(seed, width=320, height=240):
+    return np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+
+def reference(image, roi):
+    # float64 metrics as computed before the engine
+    x, y, w, h = roi
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)[y : y + h, x : x + w]
+    gx = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3)
+    gy = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3)
+    return cv2.Laplacian(gray, cv2.CV_64F).var(), np.mean(np.sqrt(gx**2 + gy**2)), gray.var() / gray.mean()
+
+
+def test_metrics_match_float64_reference():
+    image = make_image(0)
+    roi = center_roi(image)
+    focus = FocusEngine(roi).measure(image)
+    laplacian, tenengrad, normalized_variance = reference(image, roi)
+    assert np.isclose(focus["laplacian"], laplacian, rtol=1e-9)
+    assert np.isclose(focus["tenengrad"], tenengrad, rtol=1e-6)
+    assert np.isclose(focus["normalized_variance"], normalized_variance, rtol=1e-9)
+
+
+def test_batch_reuses_buffers_across_roi_sizes():
+    images = [make_image(seed) for seed in range(3)] + [make_image(3, 160, 120)]
+    engine = FocusEngine()
+    scores = engine.measure_batch(images)
+    for image, row in zip(images, scores):
+        focus = FocusEngine().measure(image)
+        assert np.allclose(row, [focus[name] for name in FOCUS_METRICS], rtol=1e-6)
+
+
+def test_best_frame_picks_sharpest():
+    image = make_image(4)
+    images = [cv2.GaussianBlur(image, (0, 0), sigma) for sigma in (3, 1)] + [image, cv2.GaussianBlur(image, (0, 0), 2)]
+    assert FocusEngine().best_frame(images) == 2
@@ -0,0 +1,69 @@
+import os
+import struct
+import sys
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from util.jpeg_framer import JpegFramer
+
+
+def make_jpeg(seed, width=64, height=48):
+    image = np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    return cv2.imencode(".jpg", image)[1].tobytes()
+
+
+def with_exif_thumbnail(jpeg, thumbnail):
+    # APP1 segment holding a whole JPEG thumbnail, with its own SOI and EOI markers
+    data = b"Exif\0\0" + thumbnail
+    app1 = b"\xff\xe1" + struct.pack(">H", len(data) + 2) + data
+    return jpeg[:2] + app1 + jpeg[2:]
+
+
+def feed_all(framer, stream, chunk_size):
+    # Frames are only valid until the next feed, keep copies
+    frames = []
+    for i in range(0, len(stream), chunk_size):
+        frames += [bytes(frame) for frame in framer.feed(stream[i : i + chunk_size])]
+    return frames
+
+
+def test_one_byte_chunks():
+    jpegs = [make_jpeg(seed) for seed in range(3)]
+    assert feed_all(JpegFramer(), b"".join(jpegs), 1) == jpegs
+
+
+def test_markers_split_across_chunks():
+    jpegs = [make_jpeg(seed) for seed in range(2)]
+    stream = b"".join(jpegs)
+
+    # Split inside the FFD9 of the first frame and inside the FFD8 of the second one
+    eoi = len(jpegs[0]) - 1
+    for split in (eoi, eoi + 1, eoi + 2):
+        framer = JpegFramer()
+        frames = [bytes(frame) for frame in framer.feed(stream[:split])]
+        frames += [bytes(frame) for frame in framer.feed(stream[split:])]
+        assert frames == jpegs
+
+
+def test_exif_thumbnail_with_eoi():
+    thumbnail = make_jpeg(10, 16, 12)
+    assert b"\xff\xd9" in thumbnail
+    jpeg = with_exif_thumbnail(make_jpeg(11), thumbnail)
+
+    for chunk_size in (1, 7, len(jpeg)):
+        frames = feed_all(JpegFramer(), jpeg + jpeg, chunk_size)
+        assert frames == [jpeg, jpeg]
+
+
+def test_garbage_between_frames():
+    jpegs = [make_jpeg(seed) for seed in range(3)]
+    garbage = [b"\x00\x12garbage\xff", b"\xff\xff\x01", b"\xd9\xff"]
+    stream = b"".join(g + jpeg for g, jpeg in zip(garbage, jpegs)) + b"trailing"
+
+    for chunk_size in (1, 5, 4096):
+        framer = JpegFramer()
+        assert feed_all(framer, stream, chunk_size) == jpegs
+        assert framer.dropped_bytes >= sum(len(g) for g in garbage)
@@ -0,0 +1,40 @@
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from util import bayer_archive
+from util.raw_image import BAYER_CHANNELS, FlippedBayerFormat, RawImage
+from util.snapshot_header import SnapshotFormat
+
+
+def make_raw_image(format, width=16, height=12):
+    bayer = np.random.default_rng(0).integers(0, 256, (height, width), dtype=np.uint8)
+    return RawImage(bayer, format, width, height)
+
+
+@pytest.mark.parametrize("format", list(FlippedBayerFormat))
+def test_flipped_formats_are_named_by_layout(format):
+    assert format.name == f"BAYER_{bayer_archive.cfa_pattern(format)}8"
+
+
+@pytest.mark.parametrize("format", [SnapshotFormat.RAW_GRBG8, SnapshotFormat.RAW_BGGR8])
+@pytest.mark.parametrize("flip", ["horizontal_flip", "vertical_flip"])
+def test_flip_matches_flipped_demosaic(format, flip):
+    raw_image = make_raw_image(format)
+    flipped = getattr(raw_image, flip)()
+    assert flipped.format in BAYER_CHANNELS
+    expected = cv2.flip(raw_image.to_image(), 1 if flip == "horizontal_flip" else 0)
+    assert np.array_equal(flipped.to_image()[1:-1, 1:-1], expected[1:-1, 1:-1])
+
+
+def test_archive_of_flipped_frame_keeps_format_and_layout():
+    flipped = make_raw_image(SnapshotFormat.RAW_GRBG8).horizontal_flip()
+    raw_image, fields = bayer_archive.decode(bytes(bayer_archive.encode(flipped)))
+    assert (fields["format"], fields["cfa"]) == ("BAYER_GRBG8", "GRBG")
+    assert raw_image.format == FlippedBayerFormat.BAYER_GRBG8
+    assert np.array_equal(raw_image.to_bayer(), flipped.to_bayer())
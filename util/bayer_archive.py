@@ -0,0 +1,133 @@
+"""
+Lossless archive of raw frames: the Bayer mosaic as a single-channel 8-bit PNG, demosaiced later, offline.
+Snapshot header fields are stored as PNG tEXt chunks "FrameCam.<field>", e.g. FrameCam.format = BAYER_GRBG8.
+The stored mosaic is deinterleaved and flipped, the format is the flipped one and CFA names the actual layout.
+With the "planes" layout the four colour sites of the 2x2 cells are stored as tiles [[00, 01], [10, 11]]:
+neighbouring pixels then have the same colour, which the PNG filters predict much better than the mosaic.
+"""
+
+import argparse
+import os
+import struct
+import zlib
+
+import cv2
+import numpy as np
+
+from util.encoder import encode_image
+from util.isp import isp
+from util.raw_image import BAYER_CHANNELS, RAW_FORMATS, RawImage
+
+EXTENSION = "bayer.png"
+TEXT_PREFIX = "FrameCam."
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+IHDR_END = len(PNG_SIGNATURE) + 8 + 13 + 4  # IHDR is the first chunk, 13 data bytes
+
+# Pixel layouts
+MOSAIC = "mosaic"  # as captured, can be opened as a CFA image directly
+PLANES = "planes"  # colour planes as 2x2 tiles, about 1.5x smaller
+LAYOUT = PLANES
+
+
+def png_chunk(type, data):
+    return struct.pack(">I", len(data)) + type + data + struct.pack(">I", zlib.crc32(type + data))
+
+
+def add_png_text(png, fields):
+    # Inserts a tEXt chunk per field after the IHDR chunk
+    png = bytes(png)
+    chunks = b"".join(png_chunk(b"tEXt", f"{key}\0{value}".encode("latin-1")) for key, value in fields.items())
+    return png[:IHDR_END] + chunks + png[IHDR_END:]
+
+
+def read_png_text(png):
+    # Returns the tEXt chunks of a PNG as a dict
+    png = memoryview(png)
+    fields = {}
+    offset = len(PNG_SIGNATURE)
+    while offset + 8 <= len(png):
+        size, type = struct.unpack_from(">I4s", png, offset)
+        if type == b"tEXt":
+            key, _, value = bytes(png[offset + 8 : offset + 8 + size]).partition(b"\0")
+            fields[key.decode("latin-1")] = value.decode("latin-1")
+        elif type in (b"IDAT", b"IEND"):
+            break  # text chunks are written before the image data
+        offset += 12 + size
+    return fields
+
+
+def cfa_pattern(format):
+    # Actual 2x2 layout, e.g. RGGB: the device GRBG mode is an RGGB mosaic
+    return "".join("BGR"[channel] for channel in BAYER_CHANNELS[format])
+
+
+def to_planes(bayer_image):
+    return np.block([[bayer_image[0::2, 0::2], bayer_image[0::2, 1::2]], [bayer_image[1::2, 0::2], bayer_image[1::2, 1::2]]])
+
+
+def from_planes(tiles):
+    height, width = tiles.shape
+    bayer_image = np.empty_like(tiles)
+    bayer_image[0::2, 0::2] = tiles[: height // 2, : width // 2]
+    bayer_image[0::2, 1::2] = tiles[: height // 2, width // 2 :]
+    bayer_image[1::2, 0::2] = tiles[height // 2 :, : width // 2]
+    bayer_image[1::2, 1::2] = tiles[height // 2 :, width // 2 :]
+    return bayer_image
+
+
+def encode(raw_image, header=None, timestamp=None, layout=LAYOUT, settings=None):
+    # Returns the PNG archive of a raw image, header fields of the snapshot if available
+    bayer_image = raw_image.to_bayer()
+    if raw_image.width % 2 or raw_image.height % 2:
+        layout = MOSAIC  # no complete 2x2 cells
+
+    fields = {
+        "format": raw_image.format.name,
+        "cfa": cfa_pattern(raw_image.format),
+        "width": raw_image.width,
+        "height": raw_image.height,
+        "layout": layout,
+    }
+    if header is not None:
+        fields.update(device_format=header.format.name, shutter_mode=header.shutter_mode, gain_mode=header.gain_mode)
+    if timestamp is not None:
+        fields["timestamp"] = f"{timestamp:.6f}"
+
+    image = to_planes(bayer_image) if layout == PLANES else np.ascontiguousarray(bayer_image)
+    png = encode_image(".png", image, settings)
+    return add_png_text(png, {TEXT_PREFIX + key: value for key, value in fields.items()})
+
+
+def decode(buffer):
+    # Returns (raw image, fields) of a PNG archive
+    fields = {key[len(TEXT_PREFIX) :]: value for key, value in read_png_text(buffer).items() if key.startswith(TEXT_PREFIX)}
+    bayer_image = cv2.imdecode(np.frombuffer(buffer, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if bayer_image is None or bayer_image.ndim != 2 or fields.get("format") not in RAW_FORMATS:
+        raise ValueError("Not a FrameCam Bayer archive")
+    if fields.get("layout", MOSAIC) == PLANES:
+        bayer_image = from_planes(bayer_image)
+    height, width = bayer_image.shape
+    return RawImage(bayer_image, RAW_FORMATS[fields["format"]], width, height), fields
+
+
+def load(path):
+    with open(path, "rb") as f:
+        return decode(f.read())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Demosaic FrameCam Bayer archives")
+    parser.add_argument("files", metavar="FILE", nargs="+", help="Bayer archive (.bayer.png)")
+    parser.add_argument("-format", metavar="FORMAT", default="png", help="Output format, png or jpeg")
+    parser.add_argument("-isp", action="store_true", help="Auto white balance and gamma")
+
+    args = parser.parse_args()
+
+    isp.enable(args.isp)
+    ext = "jpg" if args.format == "jpeg" else args.format
+    for path in args.files:
+        raw_image, fields = load(path)
+        output = path[: -len(EXTENSION)] + ext if path.endswith(EXTENSION) else f"{path}.{ext}"
+        cv2.imwrite(output, raw_image.to_image())
+        print(f"[INFO] {os.path.basename(path)}: {fields['width']}x{fields['height']} {fields['cfa']}, saved as {output}")
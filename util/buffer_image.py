@@ -4,43 +4,84 @@ import time
 import cv2
 import numpy as np
 
+from util.encoder import encode_image
+from util.jpeg_orientation import JPEG_SOI, flip_jpeg
+from util.metrics import metrics
+
 OUTPUT_DIR = "DCIM"
 
+# File extension per save format, other formats are their own extension
+EXTENSIONS = {"jpeg": "jpg", "bayer": "bayer.png"}
+
+_created_dirs = set()
+
+
+def make_output_dir(output_dir):
+    # Creates the output directory once per process
+    if output_dir not in _created_dirs:
+        os.makedirs(output_dir, exist_ok=True)
+        _created_dirs.add(output_dir)
 
-class BufferImage:
-    def __init__(self, buffer, output_dir=OUTPUT_DIR):
-        self.buffer = buffer
-        self.output_dir = output_dir
 
-    def save(self, format="jpeg"):
-        # Create output directory if it doesn't exist
-        if not os.path.exists(OUTPUT_DIR):
-            os.makedirs(OUTPUT_DIR)
+def image_filename(output_dir, name="FrameCam", format="jpeg", sequence=None):
+    # Select file extension
+    ext = EXTENSIONS.get(format, format)
 
-        # Select file extension
-        if format == "jpeg":
-            ext = "jpg"
-        else:
-            ext = format
+    # filename format is "NAME_YYYYMMDD_HHMMSS_MSEC[_SEQUENCE].EXT"
+    now = time.time()
+    current_time = time.strftime("%Y%m%d_%H%M%S", time.localtime(now))
+    msec = int(now * 1000) % 1000
+    suffix = f"_{sequence:06d}" if sequence is not None else ""
+    return f"{output_dir}/{name}_{current_time}_{msec:03d}{suffix}.{ext}"
 
-        # filename format is "FrameCam_YYYYMMDD_HHMMSS.EXT"
-        current_time = time.strftime("%Y%m%d_%H%M%S")
-        filename = f"{self.output_dir}/FrameCam_{current_time}.{ext}"
 
-        with open(filename, "wb") as f:
-            f.write(self.buffer)
+def write_file(filename, buffer, fsync=False):
+    # Writes a new file, never overwrites: a taken name gets a counter suffix
+    make_output_dir(os.path.dirname(filename) or ".")
+    base, ext = os.path.splitext(filename)
+    counter = 0
+    while True:
+        try:
+            with metrics.timer("save"), open(filename, "xb") as f:
+                f.write(buffer)
+                if fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            return filename
+        except FileExistsError:
+            counter += 1
+            filename = f"{base}-{counter}{ext}"
+        except FileNotFoundError:
+            # Output directory removed while running
+            _created_dirs.discard(os.path.dirname(filename) or ".")
+            make_output_dir(os.path.dirname(filename) or ".")
 
+
+class BufferImage:
+    def __init__(self, buffer, output_dir=OUTPUT_DIR):
+        self.buffer = buffer
+        self.output_dir = output_dir
+
+    def save(self, format="jpeg", name="FrameCam", sequence=None):
+        filename = write_file(image_filename(self.output_dir, name, format, sequence), self.buffer)
         print(f"[INFO] Image saved as {filename}")
         return filename
 
-    def flip(self, hflip=False, vflip=False):
+    def flip(self, hflip=False, vflip=False, settings=None):
+        # JPEG is flipped losslessly by setting its EXIF orientation, decoders apply it
+        if bytes(self.buffer[:2]) == JPEG_SOI:
+            flipped_buffer = flip_jpeg(self.buffer, hflip, vflip)
+            if flipped_buffer is not None:
+                self.buffer = flipped_buffer
+                return self.buffer
+
         image_array = cv2.imdecode(np.frombuffer(self.buffer, dtype=np.uint8), cv2.IMREAD_COLOR)
         if image_array is not None:
             if hflip:
                 image_array = cv2.flip(image_array, 1)
             if vflip:
                 image_array = cv2.flip(image_array, 0)
-            _, encoded_image = cv2.imencode(".jpg", image_array)
+            encoded_image = encode_image(".jpg" if bytes(self.buffer[:2]) == JPEG_SOI else ".png", image_array, settings)
             self.buffer = encoded_image.tobytes()
 
         return self.buffer
@@ -0,0 +1,84 @@
+import time
+
+import numpy as np
+
+from util.frame import Frame
+
+BURST_NEXT = "next"  # capture the next N frames on trigger
+BURST_LAST = "last"  # keep the last N frames, save them on trigger
+
+SLOT_HEADROOM = 1.5  # slot size over the first payload, unless given
+
+
+class BurstBuffer:
+    """
+    Preallocated ring of the last received payloads and their snapshot headers.
+    Adding a frame is a single copy into its slot, decoding, encoding and saving are deferred to flush().
+    """
+
+    def __init__(self, size, slot_size=0):
+        self.size = size
+        self.storage = np.empty((size, slot_size), dtype=np.uint8) if slot_size else None
+        self.headers = [None] * size
+        self.lengths = [0] * size
+        self.timestamps = [0.0] * size
+        self.next = 0  # slot of the next frame
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def full(self):
+        return self.count == self.size
+
+    def clear(self):
+        self.next = 0
+        self.count = 0
+
+    def add(self, header, payload, timestamp=None):
+        # Payload as received, raw images are stored interleaved
+        payload = np.frombuffer(payload, dtype=np.uint8) if not isinstance(payload, np.ndarray) else payload.reshape(-1)
+        if self.storage is None or len(payload) > self.storage.shape[1]:
+            # JPEG sizes vary from frame to frame, slots get headroom over the first frame
+            self._grow(int(max(len(payload), header.image_size if header is not None else 0) * SLOT_HEADROOM))
+
+        slot = self.next
+        self.storage[slot, : len(payload)] = payload
+        self.headers[slot] = header
+        self.lengths[slot] = len(payload)
+        self.timestamps[slot] = time.time() if timestamp is None else timestamp
+
+        self.next = (slot + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def _grow(self, slot_size):
+        # Held frames are copied into the larger slots, never dropped
+        storage = np.empty((self.size, slot_size), dtype=np.uint8)
+        if self.storage is not None:
+            print(f"[WARN] Burst frame does not fit, slots grown to {slot_size} bytes")
+            storage[:, : self.storage.shape[1]] = self.storage
+        self.storage = storage
+
+    def frames(self):
+        # Held frames oldest first as (timestamp, header, payload view)
+        first = (self.next - self.count) % self.size
+        for i in range(self.count):
+            slot = (first + i) % self.size
+            yield self.timestamps[slot], self.headers[slot], self.storage[slot, : self.lengths[slot]]
+
+    def flush(self, writer, format="jpeg", vflip=False, hflip=False, name="FrameCamBurst", encoder=None):
+        # Encodes the held frames and queues them for saving, returns the number of frames
+        # With an encoder pool, frames are copied out of the buffer and encoded in parallel
+        count = self.count
+        start = time.monotonic()
+        for sequence, (timestamp, header, payload) in enumerate(self.frames()):
+            frame = Frame(header, payload.data, hflip=hflip, vflip=vflip, timestamp=timestamp)
+            frame_format = format if not frame.is_jpeg() else "jpeg"
+            if encoder:
+                encoder.save(frame, writer, frame_format, name=name, sequence=sequence)
+            else:
+                writer.write(frame.encoded(frame_format), frame_format, name=name, sequence=sequence)
+        self.clear()
+
+        print(f"[INFO] Burst of {count} frames {'queued for encoding' if encoder else 'encoded'} in {time.monotonic() - start:.2f}s")
+        return count
@@ -0,0 +1,165 @@
+import queue
+import threading
+import time
+
+_STOP = object()
+
+
+class StageStats:
+    def __init__(self, name, workers=1):
+        self.name = name
+        self.workers = workers
+        self.count = 0
+        self.errors = 0
+        self.busy_time = 0.0  # time spent doing the work
+        self.max_time = 0.0
+        self.wait_time = 0.0  # time spent waiting for input
+        self.blocked_time = 0.0  # time spent waiting for the next stage queue
+        self.start_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def add(self, busy, wait=0.0, blocked=0.0, error=False):
+        with self.lock:
+            self.count += 1
+            self.busy_time += busy
+            self.max_time = max(self.max_time, busy)
+            self.wait_time += wait
+            self.blocked_time += blocked
+            if error:
+                self.errors += 1
+
+    def utilization(self):
+        elapsed = time.monotonic() - self.start_time
+        if elapsed <= 0:
+            return 0.0
+        return self.busy_time / (elapsed * self.workers)
+
+    def __str__(self):
+        avg_ms = self.busy_time * 1000 / self.count if self.count else 0.0
+        return (
+            f"{self.name:>10}: {self.count} frames, avg {avg_ms:.1f}ms, max {self.max_time * 1000:.1f}ms, "
+            f"busy {self.utilization() * 100:.0f}%, waiting {self.wait_time:.1f}s, blocked {self.blocked_time:.1f}s"
+            + (f", errors {self.errors}" if self.errors else "")
+        )
+
+
+class PipelineStage:
+    def __init__(self, name, func, workers=1):
+        # func(item) returns the item for the next stage, or None to drop it
+        self.name = name
+        self.func = func
+        self.workers = workers
+
+
+class CapturePipeline:
+    """
+    Runs processing stages on worker threads connected by bounded queues.
+    The capture loop submits frames from its own thread and gets blocked only when the first queue is full.
+    Frames keep their submit order: results of a stage with several workers pass a reorder buffer
+    before the next stage, a worker does not run more than a reorder window ahead of the oldest frame.
+    """
+
+    def __init__(self, stages, queue_depth=2):
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=queue_depth) for _ in stages]
+        self.stats = {"read": StageStats("read")}
+        for stage in stages:
+            self.stats[stage.name] = StageStats(stage.name, stage.workers)
+
+        self.threads = []
+        self.last_submit_time = None
+        self.sequence = 0  # sequence number of the next submitted frame
+
+        # Per stage: results that finished ahead of an older frame, the sequence number to pass on next
+        # and the number of frames passed on, the sequence numbers of the next stage
+        self.reorder = [{} for _ in stages]
+        self.next_sequence = [0 for _ in stages]
+        self.passed = [0 for _ in stages]
+        self.reorder_window = [stage.workers + queue_depth for stage in stages]
+        self.reorder_locks = [threading.Condition() for _ in stages]
+
+    def start(self):
+        for index, stage in enumerate(self.stages):
+            stage_threads = []
+            for i in range(stage.workers):
+                thread = threading.Thread(target=self._worker, args=(index,), name=f"{stage.name}-{i}", daemon=True)
+                thread.start()
+                stage_threads.append(thread)
+            self.threads.append(stage_threads)
+
+    def submit(self, item, read_time=0.0):
+        # Account the time the reader spent since the previous submit as waiting
+        now = time.monotonic()
+        wait = 0.0
+        if self.last_submit_time is not None:
+            wait = max(0.0, now - self.last_submit_time - read_time)
+
+        self.queues[0].put((self.sequence, item))
+        self.sequence += 1
+
+        self.last_submit_time = time.monotonic()
+        self.stats["read"].add(read_time, wait=wait, blocked=self.last_submit_time - now)
+
+    def _worker(self, index):
+        stage = self.stages[index]
+        stats = self.stats[stage.name]
+        input_queue = self.queues[index]
+        output_queue = self.queues[index + 1] if index + 1 < len(self.queues) else None
+
+        while True:
+            wait_start = time.monotonic()
+            item = input_queue.get()
+            if item is _STOP:
+                return
+            sequence, item = item
+
+            # Stay within the reorder window, the oldest frame is being processed by another worker
+            reorder_lock = self.reorder_locks[index]
+            with reorder_lock:
+                reorder_lock.wait_for(lambda: sequence < self.next_sequence[index] + self.reorder_window[index])
+
+            start = time.monotonic()
+            error = False
+            try:
+                result = stage.func(item)
+            except Exception as e:
+                print(f"[ERROR] Pipeline stage '{stage.name}' failed: {e}")
+                result = None
+                error = True
+            end = time.monotonic()
+
+            self._pass_on(index, sequence, result, output_queue)
+            stats.add(end - start, wait=start - wait_start, blocked=time.monotonic() - end, error=error)
+
+    def _pass_on(self, index, sequence, result, output_queue):
+        # Queues the results of this stage for the next one in sequence order, dropped frames (None) are skipped
+        reorder_lock = self.reorder_locks[index]
+        with reorder_lock:
+            reorder = self.reorder[index]
+            reorder[sequence] = result
+            while self.next_sequence[index] in reorder:
+                result = reorder.pop(self.next_sequence[index])
+                self.next_sequence[index] += 1
+                if result is not None and output_queue is not None:
+                    output_queue.put((self.passed[index], result))
+                    self.passed[index] += 1
+            reorder_lock.notify_all()
+
+    def stop(self):
+        # Let every stage drain its queue before stopping the next one
+        for index, stage_threads in enumerate(self.threads):
+            for _ in stage_threads:
+                self.queues[index].put(_STOP)
+            for thread in stage_threads:
+                thread.join()
+        self.threads = []
+
+    def bottleneck(self):
+        return max(self.stats.values(), key=lambda stats: stats.utilization()).name
+
+    def report(self):
+        lines = ["[INFO] Pipeline stage report:"]
+        for stats in self.stats.values():
+            lines.append(f"[INFO] {stats}")
+        lines.append(f"[INFO] Bottleneck stage: {self.bottleneck()}")
+        return "\n".join(lines)
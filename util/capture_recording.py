@@ -0,0 +1,134 @@
+"""
+Capture recording container:
+    file header:  magic "FCREC" + version
+    records:      record header (magic, timestamp, payload size) + 20-byte snapshot header + payload
+    index:        (record offset, timestamp, payload size) per record
+    footer:       index offset, record count, magic
+Records are appended as they are captured, the index is written on close.
+A recording without index (e.g. after a crash) is indexed by scanning the records.
+"""
+
+import mmap
+import struct
+import time
+
+from util.snapshot_header import SNAPSHOT_HEADER_SIZE, SnapshotHeader
+
+FILE_MAGIC = b"FCREC\x00\x01\x00"
+RECORD_MAGIC = b"FREC"
+FOOTER_MAGIC = b"FCRECIDX"
+
+RECORD_HEADER = struct.Struct("<4sdI")  # magic, timestamp, payload size
+INDEX_ENTRY = struct.Struct("<QdI")  # record offset, timestamp, payload size
+FOOTER = struct.Struct("<QI8s")  # index offset, record count, magic
+
+
+class RecordedFrame:
+    def __init__(self, timestamp, header, payload):
+        self.timestamp = timestamp
+        self.header = header
+        self.payload = payload  # memoryview into the mapped recording
+
+
+class CaptureRecorder:
+    # Appends captured snapshot headers and payloads to a recording
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "wb")
+        self.file.write(FILE_MAGIC)
+        self.index = []
+
+    def write(self, snapshot_header, payload, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+
+        offset = self.file.tell()
+        self.file.write(RECORD_HEADER.pack(RECORD_MAGIC, timestamp, len(payload)))
+        self.file.write(bytes(snapshot_header.buffer[:SNAPSHOT_HEADER_SIZE]))
+        self.file.write(payload)
+        self.index.append((offset, timestamp, len(payload)))
+
+    def close(self):
+        if self.file.closed:
+            return
+
+        # Write trailing index
+        index_offset = self.file.tell()
+        for entry in self.index:
+            self.file.write(INDEX_ENTRY.pack(*entry))
+        self.file.write(FOOTER.pack(index_offset, len(self.index), FOOTER_MAGIC))
+        self.file.close()
+        print(f"[INFO] Recorded {len(self.index)} frames to {self.path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CaptureReader:
+    # Zero-copy random access to the frames of a recording
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+
+        if self.map[: len(FILE_MAGIC)] != FILE_MAGIC:
+            raise ValueError(f"Not a capture recording: {path}")
+
+        self.index = self._read_index()
+        if self.index is None:
+            print(f"[WARN] Recording {path} has no index, scanning records...")
+            self.index = self._scan_index()
+
+    def _read_index(self):
+        if len(self.map) < len(FILE_MAGIC) + FOOTER.size:
+            return None
+        index_offset, count, magic = FOOTER.unpack_from(self.map, len(self.map) - FOOTER.size)
+        if magic != FOOTER_MAGIC or index_offset + count * INDEX_ENTRY.size != len(self.map) - FOOTER.size:
+            return None
+        return [INDEX_ENTRY.unpack_from(self.map, index_offset + i * INDEX_ENTRY.size) for i in range(count)]
+
+    def _scan_index(self):
+        index = []
+        offset = len(FILE_MAGIC)
+        while offset + RECORD_HEADER.size + SNAPSHOT_HEADER_SIZE <= len(self.map):
+            magic, timestamp, size = RECORD_HEADER.unpack_from(self.map, offset)
+            end = offset + RECORD_HEADER.size + SNAPSHOT_HEADER_SIZE + size
+            if magic != RECORD_MAGIC or end > len(self.map):
+                break  # truncated record
+            index.append((offset, timestamp, size))
+            offset = end
+        return index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, n):
+        offset, timestamp, size = self.index[n]
+        header_offset = offset + RECORD_HEADER.size
+        payload_offset = header_offset + SNAPSHOT_HEADER_SIZE
+        header = SnapshotHeader(bytes(self.view[header_offset:payload_offset]))
+        return RecordedFrame(timestamp, header, self.view[payload_offset : payload_offset + size])
+
+    def __iter__(self):
+        for n in range(len(self)):
+            yield self[n]
+
+    def close(self):
+        self.view.release()
+        try:
+            self.map.close()
+        except BufferError:
+            pass  # payloads still referenced, unmapped when they are released
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
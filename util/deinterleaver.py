@@ -0,0 +1,88 @@
+import numpy as np
+
+
+def band_view(image, interleaving):
+    """
+    Returns a view of the deinterleaved image as [band, row in band, x].
+    Lines where (y % interleaving == i) are transmitted in band i, so the row permutation is a pure reshape/transpose
+    and a whole frame is deinterleaved by a single strided copy into this view.
+    """
+    height, width = image.shape
+    if height % interleaving != 0:
+        raise ValueError(f"Image height {height} is not a multiple of interleaving {interleaving}")
+
+    return image.reshape(height // interleaving, interleaving, width).transpose(1, 0, 2)
+
+
+class Deinterleaver:
+    """
+    Deinterleaves a raw frame while it is being received.
+    Rows are copied to their final place as soon as they arrive, into a reusable output buffer.
+    """
+
+    def __init__(self, width, height, interleaving, reuse_output=True):
+        self.width = width
+        self.height = height
+        self.interleaving = interleaving
+        self.band_height = height // interleaving
+        self.reuse_output = reuse_output
+
+        self.output = None
+        self.reset()
+
+    @property
+    def frame_size(self):
+        return self.width * self.height
+
+    def reset(self):
+        # Start a new frame
+        if self.output is None or not self.reuse_output:
+            self.output = np.empty((self.height, self.width), dtype=np.uint8)
+        self.bands = band_view(self.output, self.interleaving)
+        self.received = 0
+        self.row = 0
+        self.partial = bytearray()
+
+    def done(self):
+        return self.received >= self.frame_size
+
+    def feed(self, data):
+        # Feed next received bytes, returns number of bytes consumed
+        data = memoryview(data).cast("B")[: self.frame_size - self.received]
+        consumed = len(data)
+        self.received += consumed
+
+        # Complete partially received row
+        if self.partial:
+            needed = self.width - len(self.partial)
+            self.partial += data[:needed]
+            data = data[needed:]
+            if len(self.partial) < self.width:
+                return consumed
+            self._write_rows(np.frombuffer(self.partial, dtype=np.uint8).reshape(1, self.width))
+            self.partial = bytearray()
+
+        # Copy complete rows
+        rows = len(data) // self.width
+        if rows:
+            self._write_rows(np.frombuffer(data[: rows * self.width], dtype=np.uint8).reshape(rows, self.width))
+
+        # Keep the rest of the row
+        self.partial += data[rows * self.width :]
+        return consumed
+
+    def _write_rows(self, rows):
+        while len(rows):
+            band, band_row = divmod(self.row, self.band_height)
+            count = min(self.band_height - band_row, len(rows))
+            self.bands[band, band_row : band_row + count] = rows[:count]
+            rows = rows[count:]
+            self.row += count
+
+    def deinterleave(self, bayer_interleaved):
+        # Deinterleave complete frame into the output buffer
+        self.reset()
+        self.bands[...] = bayer_interleaved.reshape(self.interleaving, self.band_height, self.width)
+        self.received = self.frame_size
+        self.row = self.height
+        return self.output
@@ -1,16 +1,47 @@
-import serial.tools.list_ports
-import time
+import serial
+
+from util.device_watcher import DeviceWatcher
 
 VID_LIST = [0x1A86, 12619]
 PID_LIST = [0xFE01]
 
+BAUDRATE = 460800
+
+
+_watchers = {}
+
+
+def device_watcher(target_vid_list=VID_LIST, target_pid_list=PID_LIST, watch_dir=None):
+    # Watchers are kept for reconnects, closing inotify is slow
+    key = (tuple(target_vid_list), tuple(target_pid_list), watch_dir)
+    if key not in _watchers:
+        _watchers[key] = DeviceWatcher(target_vid_list, target_pid_list, watch_dir)
+    return _watchers[key]
 
-def find_device_by_vid_pid(target_vid_list=VID_LIST, target_pid_list=PID_LIST):
-    while True:
-        ports = serial.tools.list_ports.comports()
-        for port in ports:
-            if port.vid in target_vid_list and port.pid in target_pid_list:
-                print(f"[INFO] Found device: {port.device}")
-                return port.device
+
+def find_devices_by_vid_pid(target_vid_list=VID_LIST, target_pid_list=PID_LIST, watch_dir=None):
+    # Returns all currently connected matching ports, sorted by name
+    return device_watcher(target_vid_list, target_pid_list, watch_dir).devices()
+
+
+def find_device_by_vid_pid(target_vid_list=VID_LIST, target_pid_list=PID_LIST, watch_dir=None):
+    # Waits for a matching port, returns as soon as one is plugged in
+    watcher = device_watcher(target_vid_list, target_pid_list, watch_dir)
+    devices = watcher.devices()
+    if not devices:
         print("[WAIT] Waiting for USB device to be connected...")
-        time.sleep(1)  # Wait before retrying
+        devices = watcher.wait()
+    print(f"[INFO] Found device: {devices[0]}")
+    return devices[0]
+
+
+def open_device(port, timeout=1.0):
+    # Port name or pyserial URL (socket://host:port, loop://...)
+    return serial.serial_for_url(
+        port,
+        baudrate=BAUDRATE,
+        bytesize=serial.EIGHTBITS,
+        parity=serial.PARITY_NONE,
+        stopbits=serial.STOPBITS_ONE,
+        timeout=timeout,
+    )
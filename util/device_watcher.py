@@ -0,0 +1,199 @@
+"""
+FrameCam hotplug detection.
+On Linux the serial link directory (/dev/serial/by-id) is watched with inotify and only listed again when it changes,
+so a plugged camera is found as soon as udev links it. Without inotify, or without the directory, ports are polled.
+VID/PID of a device node are looked up in sysfs once and cached.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+import serial.tools.list_ports
+
+SERIAL_BY_ID = "/dev/serial/by-id"
+POLL_INTERVAL = 1.0  # seconds, also the longest wait for a missed inotify event
+COMPORTS_DEBOUNCE = 0.1  # seconds between port listings on inotify events, while the link directory is missing
+
+# inotify event mask
+IN_ATTRIB = 0x004
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_IGNORED = 0x8000  # watch removed, e.g. the watched directory was deleted
+WATCH_MASK = IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+WATCH_GONE = IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED
+
+EVENT_HEADER = struct.Struct("iIII")  # watch descriptor, mask, cookie, name length
+
+_usb_ids = {}  # (device, device number, ctime) -> (vid, pid)
+
+
+def usb_ids(device):
+    # Returns (vid, pid) of a serial device node, None if it is not a USB device
+    try:
+        stat = os.stat(device)
+    except OSError:
+        return None
+
+    # A replugged device gets a new node, so it is looked up again
+    key = (device, stat.st_rdev, stat.st_ctime_ns)
+    if key not in _usb_ids:
+        from serial.tools.list_ports_linux import SysFS
+
+        info = SysFS(device)
+        _usb_ids[key] = (info.vid, info.pid) if info.vid is not None else None
+    return _usb_ids[key]
+
+
+class Inotify:
+    # Minimal inotify binding, watches one path at a time
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.path = None
+        self.wd = None
+
+    def watch(self, path):
+        if path == self.path:
+            return
+        if self.wd is not None:
+            self.libc.inotify_rm_watch(self.fd, self.wd)  # fails if the path is gone, the watch is then removed already
+        self.wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        self.path = path if self.wd >= 0 else None
+        if self.wd < 0:
+            self.wd = None
+
+    def wait(self, timeout):
+        # Returns True if there were events within timeout, the events are dropped
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return False
+        try:
+            while True:
+                data = os.read(self.fd, 64 * 1024)
+                if not data:
+                    break
+                self._check_watch(data)
+        except BlockingIOError:
+            pass
+        return True
+
+    def _check_watch(self, data):
+        # A deleted or moved directory ends its watch, it is added again by the next watch() call
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, name_size = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size + name_size
+            if wd == self.wd and mask & WATCH_GONE:
+                if not mask & IN_IGNORED:
+                    self.libc.inotify_rm_watch(self.fd, self.wd)
+                self.path = None
+                self.wd = None
+
+    def close(self):
+        os.close(self.fd)
+
+
+class DeviceWatcher:
+    """
+    Lists connected FrameCams and waits for one to be plugged in.
+    watch_dir holds links to the serial device nodes, as /dev/serial/by-id does, the default on Linux.
+    If it does not exist yet, its nearest existing parent is watched until it is created.
+    """
+
+    def __init__(self, vids, pids, watch_dir=None, poll_interval=POLL_INTERVAL, lookup=usb_ids, use_inotify=True):
+        self.vids = vids
+        self.pids = pids
+        self.default_dir = watch_dir is None
+        self.watch_dir = watch_dir if watch_dir is not None else (SERIAL_BY_ID if sys.platform.startswith("linux") else None)
+        self.poll_interval = poll_interval
+        self.lookup = lookup
+        self.use_inotify = use_inotify
+        self.inotify = None
+        self.comports_time = None  # last port listing
+
+    def _uses_comports(self):
+        # No links, e.g. not Linux or no udev
+        return self.watch_dir is None or (self.default_dir and not os.path.isdir(self.watch_dir))
+
+    def devices(self):
+        # Returns the connected devices, sorted by name
+        if self._uses_comports():
+            self.comports_time = time.monotonic()
+            ports = serial.tools.list_ports.comports()
+            return sorted(port.device for port in ports if port.vid in self.vids and port.pid in self.pids)
+
+        try:
+            names = os.listdir(self.watch_dir)
+        except FileNotFoundError:
+            return []
+
+        devices = set()
+        for name in names:
+            device = os.path.realpath(os.path.join(self.watch_dir, name))
+            ids = self.lookup(device)
+            if ids is not None and ids[0] in self.vids and ids[1] in self.pids:
+                devices.add(device)
+        return sorted(devices)
+
+    def _watch(self):
+        # Watches the link directory, or its nearest parent until it is created
+        path = self.watch_dir
+        while not os.path.isdir(path) and os.path.dirname(path) != path:
+            path = os.path.dirname(path)
+        self.inotify.watch(path)
+
+    def wait(self, timeout=None):
+        # Returns the connected devices as soon as there is one, empty list on timeout
+        if self.use_inotify and self.inotify is None and self.watch_dir is not None:
+            try:
+                self.inotify = Inotify()
+            except (OSError, AttributeError):
+                print("[WARN] inotify not available, polling for devices")
+                self.use_inotify = False
+
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            # Watch before listing, so a device plugged in between is not missed
+            if self.inotify is not None:
+                self._watch()
+            devices = self.devices()
+            if devices:
+                return devices
+
+            wait_time = self.poll_interval
+            if deadline is not None:
+                wait_time = min(wait_time, deadline - time.monotonic())
+                if wait_time <= 0:
+                    return []
+            if self.inotify is not None:
+                if self.inotify.wait(wait_time) and self._uses_comports():
+                    # Events in the parent of the missing link directory (/dev) are frequent, do not list ports on each one
+                    debounce = self.comports_time + COMPORTS_DEBOUNCE - time.monotonic()
+                    if deadline is not None:
+                        debounce = min(debounce, deadline - time.monotonic())
+                    if debounce > 0:
+                        time.sleep(debounce)
+            else:
+                time.sleep(wait_time)
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
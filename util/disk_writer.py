@@ -0,0 +1,104 @@
+import itertools
+import queue
+import threading
+import time
+
+from util.buffer_image import OUTPUT_DIR, image_filename, write_file
+
+_STOP = object()
+
+
+class DiskWriter:
+    """
+    Saves encoded images from background threads, so disk stalls do not hold up the serial link.
+    The queue is bounded: if the disk can not keep up, write() blocks (backpressure) instead of dropping frames.
+    File names get a sequence number, unique within the writer.
+    """
+
+    def __init__(self, output_dir=OUTPUT_DIR, queue_depth=32, workers=1, fsync=False, name="FrameCam"):
+        self.output_dir = output_dir
+        self.fsync = fsync  # flush every file to disk before the next one
+        self.name = name
+        self.queue = queue.Queue(maxsize=queue_depth)
+        self.sequence = itertools.count()
+        self.threads = [threading.Thread(target=self._worker, name=f"disk-writer-{i}", daemon=True) for i in range(workers)]
+
+        # Stats
+        self.lock = threading.Lock()
+        self.written = 0
+        self.bytes = 0
+        self.errors = 0
+        self.max_queued = 0
+        self.blocked_time = 0.0  # time write() waited for a free queue slot
+        self.write_time = 0.0
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def write(self, buffer, format="jpeg", name=None, sequence=None):
+        # Queues an encoded image, returns its file name
+        if sequence is None:
+            sequence = next(self.sequence)
+        filename = image_filename(self.output_dir, name or self.name, format, sequence)
+
+        # Receive buffers are reused, keep a copy
+        if isinstance(buffer, (memoryview, bytearray)):
+            buffer = bytes(buffer)
+
+        start = time.monotonic()
+        self.queue.put((filename, buffer))
+        blocked = time.monotonic() - start
+        with self.lock:
+            self.blocked_time += blocked
+            self.max_queued = max(self.max_queued, self.queue.qsize())
+        return filename
+
+    def _worker(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is _STOP:
+                    return
+
+                filename, buffer = item
+                start = time.monotonic()
+                try:
+                    filename = write_file(filename, buffer, self.fsync)
+                    print(f"[INFO] Image saved as {filename}")
+                    error = False
+                except Exception as e:
+                    print(f"[ERROR] Could not save {filename}: {e}")
+                    error = True
+
+                with self.lock:
+                    self.write_time += time.monotonic() - start
+                    if error:
+                        self.errors += 1
+                    else:
+                        self.written += 1
+                        self.bytes += len(buffer)
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        # Waits until all queued images are written
+        self.queue.join()
+
+    def stop(self):
+        for thread in self.threads:
+            if thread.is_alive():
+                self.queue.put(_STOP)
+        for thread in self.threads:
+            if thread.is_alive():
+                thread.join()
+
+    def report(self):
+        mb = self.bytes / (1024 * 1024)
+        avg_ms = self.write_time * 1000 / self.written if self.written else 0.0
+        return (
+            f"[INFO] Disk writer: {self.written} images, {mb:.1f}MB, avg {avg_ms:.1f}ms per image, "
+            f"max queued {self.max_queued}/{self.queue.maxsize}, blocked {self.blocked_time:.1f}s"
+            + (f", errors {self.errors}" if self.errors else "")
+        )
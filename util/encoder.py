@@ -0,0 +1,200 @@
+"""
+Image encoding with tunable JPEG/PNG parameters, and a worker pool that encodes frames off the capture thread.
+Settings left at None keep the OpenCV defaults. The shared `encode_settings` instance is used when none are given.
+"""
+
+import concurrent.futures
+import multiprocessing
+import queue
+import threading
+import time
+
+import cv2
+
+from util.isp import isp
+
+_STOP = object()
+
+
+class EncodeSettings:
+    def __init__(self, jpeg_quality=None, jpeg_optimize=False, png_compression=None):
+        self.jpeg_quality = jpeg_quality  # 0-100, OpenCV default 95
+        self.jpeg_optimize = jpeg_optimize  # optimized Huffman tables, a few percent smaller, slower
+        self.png_compression = png_compression  # zlib level 0-9, OpenCV default 1
+
+    def update(self, jpeg_quality=None, jpeg_optimize=None, png_compression=None):
+        # Changes the given settings only
+        if jpeg_quality is not None:
+            self.jpeg_quality = jpeg_quality
+        if jpeg_optimize is not None:
+            self.jpeg_optimize = jpeg_optimize
+        if png_compression is not None:
+            self.png_compression = png_compression
+
+    def key(self):
+        # Encoded buffers are memoized per settings
+        return (self.jpeg_quality, self.jpeg_optimize, self.png_compression)
+
+    def params(self, ext):
+        # cv2.imencode parameters for a file extension
+        params = []
+        if ext in (".jpg", ".jpeg"):
+            if self.jpeg_quality is not None:
+                params += [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality]
+            if self.jpeg_optimize:
+                params += [cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+        elif ext == ".png":
+            if self.png_compression is not None:
+                params += [cv2.IMWRITE_PNG_COMPRESSION, self.png_compression]
+        return params
+
+    def __str__(self):
+        quality = self.jpeg_quality if self.jpeg_quality is not None else "default"
+        compression = self.png_compression if self.png_compression is not None else "default"
+        return f"JPEG quality {quality}{', optimized' if self.jpeg_optimize else ''}, PNG compression {compression}"
+
+
+encode_settings = EncodeSettings()
+
+
+def encode_image(ext, image, settings=None):
+    # Encodes an image with cv2.imencode, returns the buffer
+    settings = settings or encode_settings
+    _, buffer = cv2.imencode(ext, image, settings.params(ext))
+    return buffer
+
+
+def _init_process(isp_enabled):
+    # Worker processes are spawned with the default singletons
+    isp.enable(isp_enabled)
+
+
+def _encode_frame(frame, format, settings):
+    start = time.monotonic()
+    buffer = bytes(frame.encoded(format, settings))
+    return buffer, time.monotonic() - start
+
+
+class EncoderPool:
+    """
+    Encodes frames on worker threads or processes, submit() returns a future of the encoded buffer.
+    OpenCV releases the GIL while encoding, so threads scale too and avoid copying frames to the workers.
+    Frames are detached from the receive buffers when submitted. Pending frames are bounded:
+    if the workers or the callbacks can not keep up, submit() blocks (backpressure) instead of queueing without limit.
+    Callbacks run on a delivery thread of their own, never on the workers or the process pool management thread.
+    """
+
+    def __init__(self, workers=2, processes=False, settings=None, queue_depth=4):
+        self.workers = workers
+        self.processes = processes
+        self.settings = settings or encode_settings
+        if processes:
+            # Spawned, forking a process with running capture threads is unsafe
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_process, initargs=(isp.enabled,)
+            )
+        else:
+            self.executor = concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix="encoder")
+        self.slots = threading.Semaphore(workers + queue_depth)
+        self.max_pending = workers + queue_depth
+
+        # Encoded buffers with a callback, delivered in completion order
+        self.results = queue.Queue()
+        self.delivery_thread = threading.Thread(target=self._deliver, name="encoder-delivery", daemon=True)
+        self.delivery_thread.start()
+
+        # Stats
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.encoded = 0
+        self.bytes = 0
+        self.errors = 0
+        self.max_queued = 0
+        self.blocked_time = 0.0  # time submit() waited for a free slot
+        self.encode_time = 0.0
+
+    def submit(self, frame, format="jpeg", callback=None):
+        # Queues a frame for encoding, returns a future of the encoded buffer
+        # callback(buffer) is called on the delivery thread, the frame holds its slot until the callback returns
+        frame = frame.detached()
+
+        start = time.monotonic()
+        self.slots.acquire()
+        blocked = time.monotonic() - start
+        with self.lock:
+            self.blocked_time += blocked
+            self.pending += 1
+            self.max_queued = max(self.max_queued, self.pending)
+
+        result = concurrent.futures.Future()
+        try:
+            future = self.executor.submit(_encode_frame, frame, format, self.settings)
+        except Exception:
+            self._done()
+            raise
+        future.add_done_callback(lambda future: self._finished(future, result, format, callback))
+        return result
+
+    def _done(self):
+        with self.lock:
+            self.pending -= 1
+        self.slots.release()
+
+    def _finished(self, future, result, format, callback):
+        # Runs on a worker thread or the process pool management thread, must not block
+        try:
+            buffer, seconds = future.result()
+        except Exception as e:
+            with self.lock:
+                self.errors += 1
+            if callback is not None:
+                print(f"[ERROR] Could not encode frame as {format}: {e}")
+            self._done()
+            result.set_exception(e)
+            return
+
+        with self.lock:
+            self.encoded += 1
+            self.bytes += len(buffer)
+            self.encode_time += seconds
+        if callback is not None:
+            self.results.put((callback, buffer))
+        else:
+            self._done()
+        result.set_result(buffer)
+
+    def _deliver(self):
+        # Hands encoded buffers to their callbacks, which may block (writer backpressure)
+        while True:
+            item = self.results.get()
+            if item is _STOP:
+                return
+            callback, buffer = item
+            try:
+                callback(buffer)
+            except Exception as e:
+                print(f"[ERROR] Could not deliver encoded frame: {e}")
+            finally:
+                self._done()
+
+    def save(self, frame, writer, format="jpeg", name=None, sequence=None):
+        # Encodes a frame and queues it on a DiskWriter, the file sequence number is taken in submit order
+        if sequence is None:
+            sequence = next(writer.sequence)
+        return self.submit(frame, format, lambda buffer: writer.write(buffer, format, name=name, sequence=sequence))
+
+    def stop(self):
+        # Waits for the pending frames and their callbacks
+        self.executor.shutdown(wait=True)
+        self.results.put(_STOP)
+        self.delivery_thread.join()
+
+    def report(self):
+        mb = self.bytes / (1024 * 1024)
+        avg_ms = self.encode_time * 1000 / self.encoded if self.encoded else 0.0
+        kind = "processes" if self.processes else "threads"
+        return (
+            f"[INFO] Encoder: {self.encoded} images on {self.workers} {kind}, {mb:.1f}MB, avg {avg_ms:.1f}ms per image, "
+            f"max pending {self.max_queued}/{self.max_pending}, blocked {self.blocked_time:.1f}s"
+            + (f", errors {self.errors}" if self.errors else "")
+        )
@@ -1,26 +1,104 @@
 import cv2
 import numpy as np
 
+FOCUS_METRICS = ("laplacian", "tenengrad", "normalized_variance")
+
+
+def center_roi(image, fraction=3):
+    # Central 1/fraction of the image, (x, y, w, h)
+    h, w = image.shape[:2]
+    return (w // fraction, h // fraction, w // fraction, h // fraction)
+
+
+class FocusEngine:
+    """
+    Computes sharpness metrics of an image region.
+    The ROI is cropped before grayscale conversion and can be downscaled by a number of pyramid levels first.
+    Both Sobel gradients come from one cv2.spatialGradient pass, filter outputs are int16/float32 buffers
+    reused from frame to frame, so an engine is used by one thread at a time.
+    """
+
+    def __init__(self, roi=None, pyramid_levels=0):
+        self.roi = roi
+        self.pyramid_levels = pyramid_levels
+        self.shape = None
+
+    def _gray_roi(self, image):
+        if self.roi is not None:
+            x, y, w, h = self.roi
+            image = image[y : y + h, x : x + w]
+
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+        for _ in range(self.pyramid_levels):
+            image = cv2.pyrDown(image)
+
+        return image
+
+    def _buffers(self, shape):
+        # Filter outputs, allocated again only when the ROI size changes
+        if shape != self.shape:
+            self.shape = shape
+            self.laplacian = np.empty(shape, dtype=np.int16)
+            self.gx = np.empty(shape, dtype=np.int16)
+            self.gy = np.empty(shape, dtype=np.int16)
+            self.magnitude = np.empty(shape, dtype=np.float32)
+            self.gy_float = np.empty(shape, dtype=np.float32)
+
+    def measure(self, image):
+        # Returns dict of metric name -> value
+        gray = self._gray_roi(image)
+        self._buffers(gray.shape)
+
+        # Laplacian variance, 8 bit input fits int16 exactly
+        cv2.Laplacian(gray, cv2.CV_16S, self.laplacian)
+        _, laplacian_std = cv2.meanStdDev(self.laplacian)
+
+        # Tenengrad: mean gradient magnitude, both gradients in one pass
+        cv2.spatialGradient(gray, self.gx, self.gy)
+        np.copyto(self.magnitude, self.gx)
+        np.copyto(self.gy_float, self.gy)
+        cv2.magnitude(self.magnitude, self.gy_float, self.magnitude)
+        tenengrad = cv2.mean(self.magnitude)[0]
+
+        # Normalized intensity variance
+        gray_mean, gray_std = cv2.meanStdDev(gray)
+        normalized_variance = gray_std[0, 0] ** 2 / gray_mean[0, 0] if gray_mean[0, 0] > 0 else 0.0
+
+        return {
+            "laplacian": laplacian_std[0, 0] ** 2,
+            "tenengrad": tenengrad,
+            "normalized_variance": normalized_variance,
+        }
+
+    def measure_batch(self, images):
+        # Scores an autofocus sweep, returns array [frame, metric] in FOCUS_METRICS order, the filter buffers are shared by the frames
+        scores = np.empty((len(images), len(FOCUS_METRICS)), dtype=np.float32)
+        for i, image in enumerate(images):
+            metrics = self.measure(image)
+            scores[i] = [metrics[name] for name in FOCUS_METRICS]
+        return scores
+
+    def best_frame(self, images, metric="laplacian"):
+        # Index of the sharpest frame of a sweep
+        scores = self.measure_batch(images)
+        return int(np.argmax(scores[:, FOCUS_METRICS.index(metric)]))
+
 
 class FocusCalc:
     def __init__(self, image, roi):
         self.image = image
         self.roi = roi
+        self.metrics = None
+
+    def _measure(self):
+        if self.metrics is None:
+            self.metrics = FocusEngine(self.roi).measure(self.image)
+        return self.metrics
 
     def laplacian(self):
-        gray = cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
-        if self.roi is not None:
-            x, y, w, h = self.roi
-            gray = gray[y : y + h, x : x + w]
-        laplacian = cv2.Laplacian(gray, cv2.CV_64F)
-        return laplacian.var()
+        return self._measure()["laplacian"]
 
     def tenengrad(self):
-        gray = cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
-        if self.roi is not None:
-            x, y, w, h = self.roi
-            gray = gray[y : y + h, x : x + w]
-        gx = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3)
-        gy = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3)
-        magnitude = np.sqrt(gx**2 + gy**2)
-        return np.mean(magnitude)
+        return self._measure()["tenengrad"]
@@ -0,0 +1,141 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from util import bayer_archive
+from util.buffer_image import BufferImage
+from util.encoder import encode_image, encode_settings
+from util.metrics import metrics
+from util.raw_image import RawImage
+from util.snapshot_header import SnapshotFormat
+
+
+class Frame:
+    """
+    Captured frame with lazily computed and memoized representations.
+    Consumers (player, saver, focus metrics) share one decoded image and one encoded buffer per format.
+    """
+
+    def __init__(self, header=None, data=None, raw_image=None, hflip=False, vflip=False, timestamp=None, fast_preview=False):
+        self.header = header
+        self.data = data  # payload as received: JPEG bytes, raw Bayer bytes or deinterleaved Bayer array
+        self.hflip = hflip
+        self.vflip = vflip
+        self.timestamp = timestamp if timestamp is not None else time.time()  # capture time
+        self.fast_preview = fast_preview  # half resolution preview of raw frames, full demosaic only when encoded
+
+        self._raw_image = raw_image
+        self._image = None
+        self._preview = None
+        self._encoded = {}
+        self.lock = threading.RLock()
+
+    def is_jpeg(self):
+        if self._raw_image is not None:
+            return False
+        return self.header is None or self.header.format == SnapshotFormat.JPEG
+
+    def raw_image(self):
+        # Flipped raw Bayer image
+        with self.lock:
+            if self._raw_image is None:
+                interleaving = self.header.interleaving if self.header.interleaving > 0 else None
+                self._raw_image = RawImage(
+                    self.data,
+                    self.header.format,
+                    self.header.width,
+                    self.header.height,
+                    interleaving if not isinstance(self.data, np.ndarray) else None,  # already deinterleaved
+                )
+                if self.hflip or self.vflip:
+                    # Deinterleave first, so the flip is timed on its own
+                    raw_image = self._raw_image
+                    self._raw_image = RawImage(raw_image.to_bayer(), raw_image.format, raw_image.width, raw_image.height)
+                with metrics.timer("flip"):
+                    if self.hflip:
+                        self._raw_image = self._raw_image.horizontal_flip()
+                    if self.vflip:
+                        self._raw_image = self._raw_image.vertical_flip()
+            return self._raw_image
+
+    @property
+    def image(self):
+        # Decoded BGR image, flipped
+        with self.lock:
+            if self._image is None:
+                if self.is_jpeg():
+                    # EXIF orientation of the flipped JPEG is applied by the decoder
+                    self._image = cv2.imdecode(np.frombuffer(self.encoded("jpeg"), dtype=np.uint8), cv2.IMREAD_COLOR)
+                else:
+                    self._image = self.raw_image().to_image()
+            return self._image
+
+    @property
+    def preview(self):
+        # Image for display
+        with self.lock:
+            if not self.fast_preview or self.is_jpeg():
+                return self.image
+            if self._preview is None:
+                self._preview = self.raw_image().to_preview()
+            return self._preview
+
+    def encoded(self, format="jpeg", settings=None):
+        # Encoded image buffer, flipped
+        settings = settings or encode_settings
+        key = (format, settings.key())
+        with self.lock:
+            if key not in self._encoded:
+                if format == "jpeg" and self.is_jpeg():
+                    # Camera JPEG is passed through, not re-encoded
+                    buffer_image = BufferImage(self.data)
+                    if self.hflip or self.vflip:
+                        with metrics.timer("flip"):
+                            buffer_image.flip(self.hflip, self.vflip, settings)
+                    self._encoded[key] = buffer_image.buffer
+                elif format == "bayer":
+                    # Raw mosaic as received, demosaiced offline
+                    raw_image = self.raw_image()
+                    with metrics.timer("encode"):
+                        self._encoded[key] = bayer_archive.encode(raw_image, self.header, self.timestamp, settings=settings)
+                else:
+                    ext = ".jpg" if format == "jpeg" else f".{format}"
+                    image = self.image
+                    with metrics.timer("encode"):
+                        self._encoded[key] = encode_image(ext, image, settings)
+            return self._encoded[key]
+
+    def __getstate__(self):
+        # Frames are sent to encoder processes: receive buffers are copied, the lock and the preview are left out
+        with self.lock:
+            state = self.__dict__.copy()
+            del state["lock"]
+            state["_preview"] = None
+            if isinstance(self.data, np.ndarray):
+                state["data"] = self.data.copy()  # deinterleaver output is reused
+            elif self.data is not None:
+                state["data"] = bytes(self.data)
+            if self.data is not None:
+                state["_raw_image"] = None  # may be a view of the payload, built again from the copy
+            elif self._raw_image is not None:
+                raw_image = self._raw_image
+                state["_raw_image"] = RawImage(raw_image.to_bayer().copy(), raw_image.format, raw_image.width, raw_image.height)
+            state["_encoded"] = {
+                key: bytes(buffer) if isinstance(buffer, (memoryview, bytearray)) else buffer for key, buffer in self._encoded.items()
+            }
+            return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.RLock()
+
+    def detached(self):
+        # Copy that stays valid when the receive buffers are reused, keeps the decoded image and encoded buffers
+        frame = Frame.__new__(Frame)
+        frame.__setstate__(self.__getstate__())
+        return frame
+
+    def save(self, format="jpeg"):
+        return BufferImage(self.encoded(format)).save(format)
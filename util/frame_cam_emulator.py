@@ -0,0 +1,248 @@
+"""
+FrameCam device emulator on a pty (POSIX) or a TCP socket (socket://host:port).
+Implements the R/S/T/X commands with valid snapshot headers and test images, optionally throttled to a baud rate:
+    R: reset, nothing is sent
+    S: take snapshot, send header (and image with auto_transfer)
+    T: send image of the last snapshot
+    X: take snapshot, send header and image
+"""
+
+import argparse
+import os
+import select
+import socket
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from util.deinterleaver import band_view
+from util.raw_image import BAYER_CHANNELS
+from util.snapshot_header import SnapshotFormat, SnapshotHeader
+
+SHUTTER_MODE = 1
+GAIN_MODE = 2
+CHUNK_SIZE = 4096
+
+
+def make_header(format, width, height, interleaving, image_size, shutter_mode=SHUTTER_MODE, gain_mode=GAIN_MODE):
+    # Packs a 20-byte snapshot header
+    return SnapshotHeader.pack(format, width, height, interleaving, image_size, shutter_mode, gain_mode)
+
+
+def make_test_image(width, height, seq=0):
+    # Colour gradient with a moving bar, so consecutive frames differ
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[:, :, 0] = x
+    image[:, :, 1] = y
+    image[:, :, 2] = 255 - (x + y) / 2
+    bar = (seq * 16) % width
+    image[:, bar : bar + 16] = 255
+    cv2.putText(image, f"{seq}", (16, height // 2), cv2.FONT_HERSHEY_SIMPLEX, height / 240, (0, 0, 0), 2)
+    return image
+
+
+def make_payload(image, format, interleaving=0, quality=90):
+    # Encodes a BGR image as JPEG or as (interleaved) raw Bayer mosaic
+    if format == SnapshotFormat.JPEG:
+        return cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+    mosaic = np.empty(image.shape[:2], dtype=np.uint8)
+    for (dy, dx), channel in zip(((0, 0), (0, 1), (1, 0), (1, 1)), BAYER_CHANNELS[format]):
+        mosaic[dy::2, dx::2] = image[dy::2, dx::2, channel]
+
+    # Rows are sent band by band
+    if interleaving > 1:
+        return np.ascontiguousarray(band_view(mosaic, interleaving)).tobytes()
+    return mosaic.tobytes()
+
+
+class FrameCamEmulator:
+    """
+    Serves the snapshot protocol from a thread, one client at a time.
+    Test images are prepared up front and cycled, so serving costs (almost) no CPU.
+    """
+
+    def __init__(
+        self,
+        format=SnapshotFormat.JPEG,
+        width=640,
+        height=480,
+        interleaving=8,
+        baudrate=None,
+        snapshot_delay=0.0,
+        frames=8,
+        quality=90,
+        auto_transfer=False,
+        drop_every=0,
+        corrupt_every=0,
+    ):
+        self.format = format
+        self.width = width
+        self.height = height
+        self.interleaving = interleaving if format != SnapshotFormat.JPEG else 0
+        self.bytes_per_sec = baudrate / 10 if baudrate else None  # 8N1
+        self.snapshot_delay = snapshot_delay  # seconds from command to header
+        self.auto_transfer = auto_transfer  # send image right after the header, as for read_image_usb
+        self.drop_every = drop_every  # leave every Nth snapshot unanswered, to test resyncing
+        self.corrupt_every = corrupt_every  # corrupt a header byte of every Nth snapshot, to test header resynchronization
+
+        self.payloads = [make_payload(make_test_image(width, height, seq), format, self.interleaving, quality) for seq in range(frames)]
+        self.snapshots = 0
+        self.bytes_sent = 0
+
+        self.running = False
+        self.thread = None
+        self._close = None
+
+    def open_pty(self):
+        # Returns the device path of a new pty served by the emulator (POSIX only)
+        import tty
+
+        master_fd, slave_fd = os.openpty()
+        tty.setraw(slave_fd)
+        path = os.ttyname(slave_fd)
+
+        def read():
+            try:
+                return os.read(master_fd, 64)
+            except OSError:
+                return b""  # slave closed
+
+        def write(data):
+            view = memoryview(data)
+            while view:
+                view = view[os.write(master_fd, view) :]
+
+        def close():
+            os.close(master_fd)
+            os.close(slave_fd)
+
+        self._start(lambda: [(master_fd, read, write)], close)
+        print(f"[INFO] FrameCam emulator on {path}")
+        return path
+
+    def listen(self, host="127.0.0.1", port=0):
+        # Returns the socket:// URL of a new TCP server
+        server = socket.socket()
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((host, port))
+        server.listen(1)
+        url = f"socket://{host}:{server.getsockname()[1]}"
+
+        def connections():
+            while self.running:
+                if not select.select([server], [], [], 0.1)[0]:
+                    continue
+                conn, _ = server.accept()
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                with conn:
+                    yield conn, lambda: conn.recv(64), conn.sendall
+
+        self._start(connections, server.close)
+        print(f"[INFO] FrameCam emulator on {url}")
+        return url
+
+    def _start(self, connections, close):
+        self.running = True
+        self._close = close
+        self.thread = threading.Thread(target=self._serve, args=(connections,), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=1)
+        if self._close:
+            self._close()
+            self._close = None
+
+    def _serve(self, connections):
+        for conn, read, write in connections():
+            payload = None
+            while self.running:
+                if not select.select([conn], [], [], 0.1)[0]:
+                    continue
+                commands = read()
+                if not commands:
+                    break  # client gone
+
+                for cmd in commands:
+                    cmd = bytes([cmd])
+                    if cmd in (b"S", b"X"):
+                        payload = self.payloads[self.snapshots % len(self.payloads)]
+                        self.snapshots += 1
+                        if self.snapshot_delay:
+                            time.sleep(self.snapshot_delay)
+                        if self.drop_every and self.snapshots % self.drop_every == 0:
+                            payload = None  # response goes missing
+                            continue
+                        header = make_header(self.format, self.width, self.height, self.interleaving, len(payload))
+                        if self.corrupt_every and self.snapshots % self.corrupt_every == 0:
+                            header = bytearray(header)
+                            header[self.snapshots % len(SnapshotHeader.MAGIC)] ^= 0xFF
+                        self._send(write, header)
+                        if cmd == b"X" or self.auto_transfer:
+                            self._send(write, payload)
+                    elif cmd == b"T" and payload is not None:
+                        self._send(write, payload)
+                    elif cmd == b"R":
+                        payload = None
+
+    def _send(self, write, data):
+        if not self.bytes_per_sec:
+            write(data)
+            self.bytes_sent += len(data)
+            return
+
+        # Throttle to the link speed
+        start = time.monotonic()
+        for offset in range(0, len(data), CHUNK_SIZE):
+            chunk = data[offset : offset + CHUNK_SIZE]
+            write(chunk)
+            self.bytes_sent += len(chunk)
+            delay = start + (offset + len(chunk)) / self.bytes_per_sec - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FrameCam device emulator")
+    parser.add_argument("-port", metavar="PORT", type=int, help="Serve on TCP port instead of a pty")
+    parser.add_argument("-format", metavar="FORMAT", default="JPEG", help="JPEG, RAW_GRBG8 or RAW_BGGR8")
+    parser.add_argument("-width", type=int, default=640, help="Image width")
+    parser.add_argument("-height", type=int, default=480, help="Image height")
+    parser.add_argument("-interleaving", type=int, default=8, help="Raw image row interleaving")
+    parser.add_argument("-baudrate", type=int, help="Throttle to a link speed, full speed if not set")
+    parser.add_argument("-snapshot_delay", type=float, default=0.0, help="Seconds from snapshot command to header")
+    parser.add_argument("-auto_transfer", action="store_true", help="Send image right after the header (read_image_usb)")
+    parser.add_argument("-drop_every", metavar="N", type=int, default=0, help="Leave every Nth snapshot unanswered")
+    parser.add_argument("-corrupt_every", metavar="N", type=int, default=0, help="Corrupt a header byte of every Nth snapshot")
+
+    args = parser.parse_args()
+
+    emulator = FrameCamEmulator(
+        SnapshotFormat[args.format.upper()],
+        args.width,
+        args.height,
+        args.interleaving,
+        args.baudrate,
+        args.snapshot_delay,
+        auto_transfer=args.auto_transfer,
+        drop_every=args.drop_every,
+        corrupt_every=args.corrupt_every,
+    )
+    if args.port:
+        emulator.listen("127.0.0.1", args.port)
+    else:
+        emulator.open_pty()
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print(f"[INFO] Exiting, {emulator.snapshots} snapshots served")
+        emulator.stop()
@@ -0,0 +1,87 @@
+"""
+Colour processing of demosaiced raw images: auto white balance, optional colour matrix and gamma.
+White balance gains and gamma are folded into one per-channel lookup table, applied in place with cv2.LUT.
+Tables are cached and only rebuilt when the smoothed gains change.
+"""
+
+import threading
+
+import cv2
+import numpy as np
+
+AWB_SUBSAMPLE = 8  # AWB statistics on every 8th pixel of every 8th row
+AWB_SMOOTHING = 0.2  # EMA weight of the current frame gains
+GAIN_STEP = 1 / 256  # gains are quantized, tables are reused while the quantized gains do not change
+
+
+def gamma_table(gamma=2.2):
+    return (np.power(np.arange(256) / 255.0, 1.0 / gamma) * 255.0 + 0.5).astype(np.uint8)
+
+
+class Isp:
+    """
+    Gray-world white balance on a subsampled image, smoothed over frames, and gamma as a fused LUT.
+    With a colour matrix, the gains are applied in linear space, then the matrix, then gamma.
+    The shared `isp` instance is used by RawImage, it is disabled by default.
+    """
+
+    def __init__(self, enabled=False, gamma=2.2, awb=True, ccm=None, smoothing=AWB_SMOOTHING, subsample=AWB_SUBSAMPLE):
+        self.enabled = enabled
+        self.gamma = gamma
+        self.awb = awb
+        self.ccm = np.asarray(ccm, dtype=np.float32) if ccm is not None else None  # 3x3 on BGR
+        self.smoothing = smoothing
+        self.subsample = subsample
+
+        self.gains = None  # smoothed (b, g, r) gains
+        self.lock = threading.Lock()
+        self._tables_key = None
+        self._tables = None
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def update_gains(self, image):
+        # Gray-world gains of this frame, blended into the smoothed gains
+        sample = image[:: self.subsample, :: self.subsample]
+        means = np.maximum(cv2.mean(sample)[:3], 1.0)
+        gains = means.mean() / means
+        with self.lock:
+            if self.gains is None:
+                self.gains = gains
+            else:
+                self.gains = self.smoothing * gains + (1 - self.smoothing) * self.gains
+            return self.gains
+
+    def tables(self, gains):
+        # (gain/gamma LUT, gamma LUT or None) as 256x1x3 tables, cached by quantized gains
+        key = tuple(np.round(np.asarray(gains) / GAIN_STEP).astype(int))
+        with self.lock:
+            if key != self._tables_key:
+                levels = np.arange(256, dtype=np.float64)[:, None]
+                linear = np.clip(levels * (np.array(key) * GAIN_STEP) + 0.5, 0, 255).astype(np.uint8)
+                gamma = gamma_table(self.gamma)
+                if self.ccm is None:
+                    # Gains and gamma in one table
+                    self._tables = (gamma[linear].reshape(256, 1, 3), None)
+                else:
+                    self._tables = (linear.reshape(256, 1, 3), gamma)
+                self._tables_key = key
+            return self._tables
+
+    def process(self, image):
+        # Applies the colour processing to a BGR image in place, returns it
+        if not self.enabled:
+            return image
+
+        gains = self.update_gains(image) if self.awb else (1.0, 1.0, 1.0)
+        lut, gamma = self.tables(gains)
+        cv2.LUT(image, lut, dst=image)
+        if gamma is not None:
+            cv2.transform(image, self.ccm, dst=image)
+            cv2.LUT(image, gamma, dst=image)
+        return image
+
+
+# Shared instance, enabled by the capture scripts on request
+isp = Isp()
@@ -0,0 +1,155 @@
+SOI = 0xD8
+EOI = 0xD9
+SOS = 0xDA
+TEM = 0x01
+RST0 = 0xD0
+RST7 = 0xD7
+
+# Framer states
+SEEK_SOI = 0  # looking for start of image
+MARKER = 1  # at a marker between segments
+ENTROPY = 2  # inside entropy-coded scan data
+
+
+class JpegFramer:
+    """
+    Splits a JPEG byte stream into frames incrementally.
+    Marker segments are skipped by their length, so markers inside them (e.g. the EOI of an EXIF thumbnail)
+    are ignored, and scanning resumes where the previous chunk stopped.
+    Frames are returned as memoryviews into the framer buffer, valid until the next feed() call.
+    """
+
+    def __init__(self, capacity=4 * 1024 * 1024, max_frame_size=16 * 1024 * 1024):
+        self.buffer = bytearray(capacity)
+        self.max_frame_size = max_frame_size
+        self.start = 0  # start of unconsumed data (frame start when in a frame)
+        self.end = 0  # end of received data
+        self.pos = 0  # scan position
+        self.state = SEEK_SOI
+        self.frame_count = 0
+        self.dropped_bytes = 0
+
+    def reset(self):
+        self.start = self.end = self.pos = 0
+        self.state = SEEK_SOI
+
+    def pending(self):
+        # Number of received bytes not yet framed
+        return self.end - self.start
+
+    def _append(self, chunk):
+        size = len(chunk)
+
+        # Move unconsumed data to the buffer start, emitted frames are no longer referenced
+        if self.end + size > len(self.buffer):
+            pending = self.end - self.start
+            if pending + size > len(self.buffer):
+                # Grow into a new buffer, memoryviews of the old one stay valid
+                buffer = bytearray(max(2 * len(self.buffer), pending + size))
+                buffer[:pending] = self.buffer[self.start : self.end]
+                self.buffer = buffer
+            else:
+                self.buffer[:pending] = self.buffer[self.start : self.end]
+            self.pos -= self.start
+            self.start = 0
+            self.end = pending
+
+        self.buffer[self.end : self.end + size] = chunk
+        self.end += size
+
+    def feed(self, chunk):
+        # Feeds received bytes, returns list of complete frames
+        self._append(chunk)
+
+        frames = []
+        while True:
+            frame = self._scan()
+            if frame is None:
+                break
+            frames.append(frame)
+
+        # Drop runaway frames
+        if self.state != SEEK_SOI and self.end - self.start > self.max_frame_size:
+            print(f"[WARN] JPEG frame exceeds {self.max_frame_size} bytes, resynchronizing...")
+            self.dropped_bytes += self.end - self.start
+            self.state = SEEK_SOI
+            self.start = self.pos = self.end
+
+        return frames
+
+    def _scan(self):
+        buffer = self.buffer
+        end = self.end
+
+        while True:
+            if self.state == SEEK_SOI:
+                soi_pos = buffer.find(b"\xff\xd8", self.pos, end)
+                if soi_pos == -1:
+                    # Keep last byte, it can be the first half of the SOI marker
+                    keep = 1 if end > self.start and buffer[end - 1] == 0xFF else 0
+                    self.dropped_bytes += end - keep - self.start
+                    self.start = self.pos = end - keep
+                    return None
+                self.dropped_bytes += soi_pos - self.start
+                self.start = soi_pos
+                self.pos = soi_pos + 2
+                self.state = MARKER
+
+            elif self.state == MARKER:
+                pos = self.pos
+                if pos + 2 > end:
+                    return None
+                if buffer[pos] != 0xFF:
+                    print("[WARN] JPEG marker expected, resynchronizing...")
+                    self.state = SEEK_SOI
+                    continue
+
+                marker = buffer[pos + 1]
+                if marker == 0xFF:
+                    # Fill byte
+                    self.pos += 1
+                elif marker == EOI:
+                    return self._emit(pos + 2)
+                elif marker == SOI:
+                    # New image before the end of the previous one
+                    print("[WARN] JPEG SOI inside image, resynchronizing...")
+                    self.dropped_bytes += pos - self.start
+                    self.start = pos
+                    self.pos = pos + 2
+                elif marker == TEM or RST0 <= marker <= RST7:
+                    # Markers without length
+                    self.pos += 2
+                else:
+                    # Skip marker segment by its length
+                    if pos + 4 > end:
+                        return None
+                    length = (buffer[pos + 2] << 8) | buffer[pos + 3]
+                    if pos + 2 + length > end:
+                        return None
+                    self.pos = pos + 2 + length
+                    if marker == SOS:
+                        self.state = ENTROPY
+
+            else:
+                # Scan data: only 0xFF followed by a non-zero, non-RST byte is a marker
+                marker_pos = buffer.find(b"\xff", self.pos, end)
+                if marker_pos == -1 or marker_pos + 1 >= end:
+                    self.pos = end if marker_pos == -1 else marker_pos
+                    return None
+
+                marker = buffer[marker_pos + 1]
+                if marker == 0x00 or RST0 <= marker <= RST7:
+                    self.pos = marker_pos + 2
+                elif marker == 0xFF:
+                    self.pos = marker_pos + 1
+                else:
+                    # EOI or next segment (e.g. another scan of a progressive JPEG)
+                    self.pos = marker_pos
+                    self.state = MARKER
+
+    def _emit(self, frame_end):
+        frame = memoryview(self.buffer)[self.start : frame_end]
+        self.start = self.pos = frame_end
+        self.state = SEEK_SOI
+        self.frame_count += 1
+        return frame
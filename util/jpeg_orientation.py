@@ -0,0 +1,115 @@
+import struct
+
+JPEG_SOI = b"\xff\xd8"
+APP0 = 0xE0
+APP1 = 0xE1
+SOS = 0xDA
+
+EXIF_ID = b"Exif\x00\x00"
+ORIENTATION_TAG = 0x0112
+
+# EXIF orientation as a transform of (x, y) needed to display the stored image
+ORIENTATION_MATRICES = {
+    1: ((1, 0), (0, 1)),  # normal
+    2: ((-1, 0), (0, 1)),  # horizontal flip
+    3: ((-1, 0), (0, -1)),  # rotate 180
+    4: ((1, 0), (0, -1)),  # vertical flip
+    5: ((0, 1), (1, 0)),  # transpose
+    6: ((0, -1), (1, 0)),  # rotate 90 CW
+    7: ((0, -1), (-1, 0)),  # transverse
+    8: ((0, 1), (-1, 0)),  # rotate 90 CCW
+}
+MATRIX_ORIENTATIONS = {matrix: orientation for orientation, matrix in ORIENTATION_MATRICES.items()}
+
+# Big endian TIFF with IFD0 holding only the orientation tag
+EXIF_TEMPLATE = (
+    EXIF_ID + b"MM\x00\x2a" + struct.pack(">IH", 8, 1) + struct.pack(">HHIHH", ORIENTATION_TAG, 3, 1, 1, 0) + struct.pack(">I", 0)
+)
+EXIF_ORIENTATION_OFFSET = len(EXIF_TEMPLATE) - 8  # value of the orientation entry
+
+
+def compose_orientation(orientation, hflip=False, vflip=False):
+    # Orientation for displaying the image flipped after the current orientation
+    (a, b), (c, d) = ORIENTATION_MATRICES[orientation]
+    sx = -1 if hflip else 1
+    sy = -1 if vflip else 1
+    return MATRIX_ORIENTATIONS[((sx * a, sx * b), (sy * c, sy * d))]
+
+
+def _segments(buffer):
+    # Yields (marker, start, end) for the marker segments before the image data
+    pos = 2
+    while pos + 4 <= len(buffer) and buffer[pos] == 0xFF:
+        marker = buffer[pos + 1]
+        if marker == SOS:
+            return
+        length = int.from_bytes(buffer[pos + 2 : pos + 4], "big")
+        yield marker, pos, pos + 2 + length
+        pos += 2 + length
+
+
+def _find_orientation(buffer):
+    # Returns (orientation, value position, byte order) from the EXIF segment, or None if not present
+    for marker, start, end in _segments(buffer):
+        if marker != APP1 or buffer[start + 4 : start + 10] != EXIF_ID:
+            continue
+
+        tiff = start + 10
+        order = ">" if buffer[tiff : tiff + 2] == b"MM" else "<"
+        (ifd,) = struct.unpack_from(order + "I", buffer, tiff + 4)
+        (count,) = struct.unpack_from(order + "H", buffer, tiff + ifd)
+        for i in range(count):
+            entry = tiff + ifd + 2 + i * 12
+            tag, _, _, value = struct.unpack_from(order + "HHIH", buffer, entry)
+            if tag == ORIENTATION_TAG and entry + 10 <= end:
+                return value, entry + 8, order
+        return None
+    return None
+
+
+def has_exif(buffer):
+    return any(marker == APP1 and buffer[start + 4 : start + 10] == EXIF_ID for marker, start, _ in _segments(buffer))
+
+
+def get_orientation(buffer):
+    found = _find_orientation(buffer)
+    return found[0] if found and found[0] in ORIENTATION_MATRICES else 1
+
+
+def set_orientation(buffer, orientation):
+    """
+    Sets EXIF orientation of a JPEG without touching the compressed image data.
+    Returns new JPEG buffer, or None if the JPEG has an EXIF segment without the orientation tag.
+    """
+    if bytes(buffer[:2]) != JPEG_SOI:
+        raise ValueError("Not a JPEG image")
+
+    found = _find_orientation(buffer)
+    if found:
+        # Patch existing tag in place
+        _, pos, order = found
+        patched = bytearray(buffer)
+        struct.pack_into(order + "H", patched, pos, orientation)
+        return bytes(patched)
+
+    if has_exif(buffer):
+        return None
+
+    # Insert new EXIF segment, after JFIF segment if present
+    insert_pos = 2
+    for marker, _, end in _segments(buffer):
+        if marker == APP0:
+            insert_pos = end
+        break
+
+    exif = bytearray(EXIF_TEMPLATE)
+    struct.pack_into(">H", exif, EXIF_ORIENTATION_OFFSET, orientation)
+    segment = b"\xff\xe1" + struct.pack(">H", len(exif) + 2) + exif
+    return bytes(buffer[:insert_pos]) + segment + bytes(buffer[insert_pos:])
+
+
+def flip_jpeg(buffer, hflip=False, vflip=False):
+    # Flips a JPEG losslessly via EXIF orientation, returns None if not possible
+    buffer = memoryview(buffer).cast("B")
+    orientation = compose_orientation(get_orientation(buffer), hflip, vflip)
+    return set_orientation(buffer, orientation)
@@ -1,143 +1,197 @@
 import copy
 import threading
-import cv2
-import numpy as np
 import time
+import cv2
 
-from util.focus_calc import FocusCalc
+from util.focus_calc import FocusEngine, center_roi
+from util.frame import Frame
 from util.fps_counter import FPSCounter
+from util.metrics import metrics
 
 
 class JpegStreamPlayer:
-    def __init__(self, max_width=1280, max_height=720):
+    def __init__(self, max_width=1280, max_height=720, focus_pyramid_levels=0):
         self.running = False
+        self.focus_engine = FocusEngine(pyramid_levels=focus_pyramid_levels)  # opt-in downscale before focus metrics, changes their values
         self.fps_counter = FPSCounter(alpha=0.2)
         self.max_width = max_width
         self.max_height = max_height
 
         self.save_next_frame = False
+        self.burst_requested = False
 
         self.latest_frame = None
+        self.latest_header = None
+        self.frame_seq = 0  # incremented on every new frame
         self.lock = threading.Lock()
+        self.new_frame = threading.Condition(self.lock)
 
     def start(self):
         self.running = True
         threading.Thread(target=self._display_loop, daemon=True).start()
 
-    def show_next_frame(self, image_buffer, snapshot_header=None):
+    def show_next_frame(self, frame, snapshot_header=None):
         self.fps_counter.update()
 
-        frame = cv2.imdecode(np.frombuffer(image_buffer, dtype=np.uint8), cv2.IMREAD_COLOR)
+        # Accept encoded image buffers as well as frames
+        if isinstance(frame, Frame):
+            snapshot_header = frame.header
+        else:
+            frame = Frame(data=frame)
+
+        # Decoded image is shared with other frame consumers
+        frame = frame.preview
         if frame is None:
             return
 
         with self.lock:
-            self.latest_frame = frame.copy()  # Store the latest decoded frame
+            self.latest_frame = frame  # Store the latest decoded frame, it is not modified by the display loop
             self.latest_header = copy.deepcopy(snapshot_header) if snapshot_header else None
+            self.frame_seq += 1
+            self.new_frame.notify()
 
         # reset save next frame flag
         self.save_next_frame = False
 
     def _display_loop(self):
+        shown_seq = 0
+        shown_save_flag = False
+        dirty = False
+        window_open = False
+
         while self.running:
-            frame = None
             with self.lock:
-                if self.latest_frame is not None:
-                    frame = self.latest_frame.copy()
-
-            if frame is not None:
-                # Calculate focus metrics
-                h, w = frame.shape[:2]
-                roi = (w // 3, h // 3, w // 3, h // 3)  # central third
-                focus_calc = FocusCalc(frame, roi=roi)
-                metric_laplacian = focus_calc.laplacian()
-                metric_tenengrad = focus_calc.tenengrad()
-
-                # Resize if too big
-                h, w = frame.shape[:2]
-                if w > self.max_width or h > self.max_height:
-                    scale = min(self.max_width / w, self.max_height / h)
-                    frame = cv2.resize(frame, (int(w * scale), int(h * scale)))
-
-                # Add text
-                cv2.putText(
-                    frame,
-                    f"FPS: {self.fps_counter.fps:.2f}",
-                    (10, 30),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    1,
-                    (0, 0, 255),
-                    2,
-                )
-
-                cv2.putText(
-                    frame,
-                    f"Focus: {metric_laplacian:.2f}, {metric_tenengrad:.2f}",
-                    (10, 60),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    1,
-                    (0, 0, 255),
-                    2,
-                )
-
-                if self.save_next_frame:
-                    cv2.putText(
-                        frame,
-                        "SAVED",
-                        (10, 90),
-                        cv2.FONT_HERSHEY_SIMPLEX,
-                        1,
-                        (0, 0, 255),
-                        2,
-                    )
-
-                # Add image modes in the right top corner
-                if self.latest_header is not None:
-                    modes_x = frame.shape[1] - 200
-
-                    # Shutter mode
-                    cv2.putText(
-                        frame,
-                        f"Shutter: {self.latest_header.shutter_mode}",
-                        (modes_x, 30),
-                        cv2.FONT_HERSHEY_SIMPLEX,
-                        1,
-                        (0, 0, 255),
-                        2,
-                    )
-
-                    # Gain mode
-                    cv2.putText(
-                        frame,
-                        f"Gain: {self.latest_header.gain_mode}",
-                        (modes_x, 60),
-                        cv2.FONT_HERSHEY_SIMPLEX,
-                        1,
-                        (0, 0, 255),
-                        2,
-                    )
-
-                cv2.imshow("Live Stream", frame)
-
-                # Process key events
-                key = cv2.waitKey(1) & 0xFF
-                if key == ord("q"):
-                    self.running = False
-                    break
-                elif key == ord("s") or key == ord(" "):
-                    print("[INFO] Saving next frame...")
-                    self.save_next_frame = True
-
-                # Check for window being closed
-                if not cv2.getWindowProperty("Live Stream", cv2.WND_PROP_VISIBLE):
-                    self.running = False
-                    break
-
-            else:
-                # Avoid busy loop if no frame is available
-                time.sleep(0.01)
+                if not window_open:
+                    # Nothing to pump before the first frame, wait for it
+                    self.new_frame.wait_for(lambda: self.frame_seq != shown_seq or not self.running, timeout=0.1)
+                frame_seq = self.frame_seq
+                frame = self.latest_frame
+                header = self.latest_header
+
+            # Heavy work once per new frame
+            display_start = time.perf_counter()
+            if frame is not None and frame_seq != shown_seq:
+                image, metric_laplacian, metric_tenengrad = self._prepare_frame(frame)
+                shown_seq = frame_seq
+                dirty = True
+
+            # Re-render overlays on new frame or save request only
+            if dirty or (window_open and shown_save_flag != self.save_next_frame):
+                shown_save_flag = self.save_next_frame
+                cv2.imshow("Live Stream", self._render(image, metric_laplacian, metric_tenengrad, header))
+                dirty = False
+                window_open = True
+                metrics.add("display", time.perf_counter() - display_start)
+
+            if not window_open:
+                continue
+
+            # Process key events (idle iterations only pump the GUI)
+            key = cv2.waitKey(10) & 0xFF
+            if key == ord("q"):
+                self.running = False
+                break
+            elif key == ord("s") or key == ord(" "):
+                print("[INFO] Saving next frame...")
+                self.save_next_frame = True
+            elif key == ord("b"):
+                self.burst_requested = True
+
+            # Check for window being closed
+            if not cv2.getWindowProperty("Live Stream", cv2.WND_PROP_VISIBLE):
+                self.running = False
+                break
 
         cv2.destroyAllWindows()
 
+    def _prepare_frame(self, frame):
+        # Calculate focus metrics on the central third
+        h, w = frame.shape[:2]
+        self.focus_engine.roi = center_roi(frame)
+        focus = self.focus_engine.measure(frame)
+        metric_laplacian = focus["laplacian"]
+        metric_tenengrad = focus["tenengrad"]
+
+        # Resize if too big
+        if w > self.max_width or h > self.max_height:
+            scale = min(self.max_width / w, self.max_height / h)
+            frame = cv2.resize(frame, (int(w * scale), int(h * scale)))
+
+        return frame, metric_laplacian, metric_tenengrad
+
+    def _render(self, image, metric_laplacian, metric_tenengrad, header):
+        # Draw on a copy, the frame is shared with other consumers
+        frame = image.copy()
+
+        # Add text
+        cv2.putText(
+            frame,
+            f"FPS: {self.fps_counter.fps:.2f}",
+            (10, 30),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            1,
+            (0, 0, 255),
+            2,
+        )
+
+        cv2.putText(
+            frame,
+            f"Focus: {metric_laplacian:.2f}, {metric_tenengrad:.2f}",
+            (10, 60),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            1,
+            (0, 0, 255),
+            2,
+        )
+
+        if self.save_next_frame:
+            cv2.putText(
+                frame,
+                "SAVED",
+                (10, 90),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                1,
+                (0, 0, 255),
+                2,
+            )
+
+        # Add image modes in the right top corner
+        if header is not None:
+            modes_x = frame.shape[1] - 200
+
+            # Shutter mode
+            cv2.putText(
+                frame,
+                f"Shutter: {header.shutter_mode}",
+                (modes_x, 30),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                1,
+                (0, 0, 255),
+                2,
+            )
+
+            # Gain mode
+            cv2.putText(
+                frame,
+                f"Gain: {header.gain_mode}",
+                (modes_x, 60),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                1,
+                (0, 0, 255),
+                2,
+            )
+
+        # Add stage timings in the left bottom corner
+        if metrics.enabled:
+            lines = metrics.overlay_lines()
+            y = frame.shape[0] - 10 - 20 * (len(lines) - 1)
+            for line in lines:
+                cv2.putText(frame, line, (10, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+                y += 20
+
+        return frame
+
     def stop(self):
-        self.running = False
+        with self.lock:
+            self.running = False
+            self.new_frame.notify()
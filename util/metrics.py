@@ -0,0 +1,187 @@
+"""
+Per-stage timing metrics with rolling histograms.
+Stages are timed with metrics.timer(name) or metrics.add(name, seconds) on the shared `metrics` instance.
+Metrics are disabled by default, timers are then a shared no-op and nothing is recorded.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# Capture stages in report order
+STAGES = ["header_wait", "transfer", "deinterleave", "demosaic", "flip", "encode", "save", "display"]
+
+WINDOW_SIZE = 1024  # samples per rolling histogram
+PROMETHEUS_PORT = 9108
+
+
+class StageHistogram:
+    # Rolling window of the last durations of a stage
+
+    def __init__(self, name, window_size=WINDOW_SIZE):
+        self.name = name
+        self.samples = np.zeros(window_size)
+        self.index = 0
+        self.count = 0  # total, not only in the window
+        self.total = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, seconds):
+        with self.lock:
+            self.samples[self.index] = seconds
+            self.index = (self.index + 1) % len(self.samples)
+            self.count += 1
+            self.total += seconds
+
+    def percentiles(self, quantiles=(50, 95, 99)):
+        with self.lock:
+            window = self.samples[: min(self.count, len(self.samples))].copy()
+        if not len(window):
+            return [0.0] * len(quantiles)
+        return list(np.percentile(window, quantiles))
+
+    def summary(self):
+        p50, p95, p99 = self.percentiles()
+        return {"count": self.count, "sum": self.total, "p50": p50, "p95": p95, "p99": p99}
+
+
+class _StageTimer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.add(time.perf_counter() - self.start)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    def __init__(self, enabled=False, window_size=WINDOW_SIZE):
+        self.enabled = enabled
+        self.window_size = window_size
+        self.stages = {}
+        self.lock = threading.Lock()
+
+        self.server = None
+        self.exporter = None
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def histogram(self, name):
+        histogram = self.stages.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.stages.setdefault(name, StageHistogram(name, self.window_size))
+        return histogram
+
+    def timer(self, name):
+        # Context manager timing a stage
+        if not self.enabled:
+            return _NULL_TIMER
+        return _StageTimer(self.histogram(name))
+
+    def add(self, name, seconds):
+        if self.enabled:
+            self.histogram(name).add(seconds)
+
+    def snapshot(self):
+        # Stage summaries in report order, seconds
+        order = {name: index for index, name in enumerate(STAGES)}
+        names = sorted(self.stages, key=lambda name: order.get(name, len(order)))
+        return {name: self.stages[name].summary() for name in names}
+
+    def to_json(self):
+        return json.dumps({"time": time.time(), "stages": self.snapshot()})
+
+    def to_prometheus(self):
+        lines = [
+            "# HELP frameshot_stage_seconds Duration of capture stages",
+            "# TYPE frameshot_stage_seconds summary",
+        ]
+        for name, summary in self.snapshot().items():
+            for quantile, key in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")):
+                lines.append(f'frameshot_stage_seconds{{stage="{name}",quantile="{quantile}"}} {summary[key]:.6f}')
+            lines.append(f'frameshot_stage_seconds_sum{{stage="{name}"}} {summary["sum"]:.6f}')
+            lines.append(f'frameshot_stage_seconds_count{{stage="{name}"}} {summary["count"]}')
+        return "\n".join(lines) + "\n"
+
+    def overlay_lines(self):
+        # Short per-stage lines for the video overlay
+        return [
+            f"{name}: {summary['p50'] * 1000:.1f}/{summary['p95'] * 1000:.1f}/{summary['p99'] * 1000:.1f}ms"
+            for name, summary in self.snapshot().items()
+        ]
+
+    def report(self):
+        lines = ["[INFO] Stage timing report (p50/p95/p99):"]
+        for name, summary in self.snapshot().items():
+            lines.append(
+                f"[INFO] {name:>12}: {summary['count']} samples, "
+                f"{summary['p50'] * 1000:.1f}/{summary['p95'] * 1000:.1f}/{summary['p99'] * 1000:.1f}ms"
+            )
+        return "\n".join(lines)
+
+    def export_json_lines(self, path, interval=1.0):
+        # Appends a snapshot line to path every interval seconds, from a background thread
+        def export():
+            with open(path, "a") as f:
+                while self.enabled:
+                    time.sleep(interval)
+                    f.write(self.to_json() + "\n")
+                    f.flush()
+
+        self.exporter = threading.Thread(target=export, name="metrics-json", daemon=True)
+        self.exporter.start()
+
+    def serve_prometheus(self, port=PROMETHEUS_PORT):
+        # Serves the Prometheus text format on http://localhost:port/metrics
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True).start()
+        print(f"[INFO] Metrics on http://127.0.0.1:{port}/metrics")
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server = None
+
+
+# Shared instance, enabled by the capture scripts on request
+metrics = Metrics()
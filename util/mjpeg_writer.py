@@ -0,0 +1,195 @@
+"""
+MJPEG AVI writer, JPEG frames of the camera are stored as they are received.
+    RIFF 'AVI ' { LIST 'hdrl' { avih, LIST 'strl' { strh, strf } }, LIST 'movi' { 00dc... }, idx1 }
+AVI has a constant frame rate: it is set from the average of the real frame timestamps on close,
+the timestamps are also written to a sidecar file in the mkvmerge "timestamp format v2" (ms per frame).
+"""
+
+import os
+import struct
+import threading
+
+from util.encoder import encode_image, encode_settings
+
+MAX_SEGMENT_SIZE = 1000 * 1024 * 1024  # AVI 1.0 files stay below 1GB, longer recordings continue in a new file
+
+AVIF_HASINDEX = 0x10
+AVIIF_KEYFRAME = 0x10
+
+# Header sizes
+HDRL_SIZE = 4 + (8 + 56) + (12 + (8 + 56) + (8 + 40))
+HEADER_SIZE = 12 + (8 + HDRL_SIZE) + 12  # RIFF, hdrl list, movi list header
+
+
+def jpeg_size(buffer):
+    # Returns (width, height) from the SOF marker of a JPEG, None if not found
+    data = memoryview(buffer).cast("B")
+    offset = 2
+    while offset + 9 <= len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            offset += 2
+            continue
+        length = (data[offset + 2] << 8) | data[offset + 3]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = (data[offset + 5] << 8) | data[offset + 6]
+            width = (data[offset + 7] << 8) | data[offset + 8]
+            return width, height
+        offset += 2 + length
+    return None
+
+
+class MjpegWriter:
+    """
+    Appends JPEG frames to an MJPEG AVI without re-encoding.
+    Raw frames use the memoized JPEG of the frame, saving them does not encode again. Flipped JPEGs are encoded from the decoded image.
+    """
+
+    def __init__(self, path, settings=None):
+        self.path = path
+        self.settings = settings or encode_settings  # JPEG quality of encoded frames
+        self.segment = 0
+        self.file = None
+        self.lock = threading.Lock()
+
+        self.frames = 0  # in all segments
+        self.bytes = 0
+
+    def _open_segment(self):
+        base, ext = os.path.splitext(self.path)
+        path = self.path if self.segment == 0 else f"{base}_{self.segment:03d}{ext}"
+        self.file = open(path, "wb")
+        self.file.write(bytes(HEADER_SIZE))  # written on close
+        self.segment_path = path
+        self.index = []
+        self.timestamps = []
+        self.movi_size = 4
+        self.max_frame_size = 0
+        self.width = self.height = 0
+        print(f"[INFO] Recording video to {path}")
+
+    def write(self, buffer, timestamp, width=None, height=None):
+        # Appends a JPEG buffer, timestamp in seconds
+        with self.lock:
+            if self.file is None:
+                self._open_segment()
+            elif HEADER_SIZE + self.movi_size + 8 + len(buffer) + 16 * (len(self.index) + 1) > MAX_SEGMENT_SIZE:
+                self._close_segment()
+                self._open_segment()
+
+            if not self.width:
+                size = (width, height) if width and height else jpeg_size(buffer)
+                if size:
+                    self.width, self.height = size
+
+            size = len(buffer)
+            self.index.append((self.movi_size, size))
+            self.file.write(b"00dc" + struct.pack("<I", size))
+            self.file.write(buffer)
+            if size % 2:
+                self.file.write(b"\0")
+            self.movi_size += 8 + size + size % 2
+            self.max_frame_size = max(self.max_frame_size, size)
+            self.timestamps.append(timestamp)
+
+            self.frames += 1
+            self.bytes += size
+
+    def write_frame(self, frame):
+        # Passes the received JPEG through, encodes other frames once
+        if frame.is_jpeg() and not (frame.hflip or frame.vflip):
+            buffer = frame.data
+        elif frame.is_jpeg():
+            # Players ignore EXIF orientation, flipped JPEGs are encoded with flipped pixels
+            buffer = encode_image(".jpg", frame.image, self.settings)
+        else:
+            # Memoized, a saved raw frame shares this encode
+            buffer = frame.encoded("jpeg", self.settings)
+        header = frame.header
+        self.write(buffer, frame.timestamp, header.width if header else None, header.height if header else None)
+
+    def _close_segment(self):
+        # Index
+        self.file.write(b"idx1" + struct.pack("<I", 16 * len(self.index)))
+        for offset, size in self.index:
+            self.file.write(b"00dc" + struct.pack("<III", AVIIF_KEYFRAME, offset, size))
+        file_size = self.file.tell()
+
+        # Frame rate from real timestamps
+        count = len(self.timestamps)
+        duration = self.timestamps[-1] - self.timestamps[0] if count > 1 else 0.0
+        fps = (count - 1) / duration if duration > 0 else 1.0
+        usec_per_frame = int(round(1000000 / fps))
+        rate = int(round(fps * 1000))
+
+        avih = struct.pack(
+            "<14I",
+            usec_per_frame,
+            int(self.max_frame_size * fps),  # max bytes per sec
+            0,
+            AVIF_HASINDEX,
+            count,
+            0,
+            1,  # streams
+            self.max_frame_size,
+            self.width,
+            self.height,
+            0,
+            0,
+            0,
+            0,
+        )
+        strh = b"vidsMJPG" + struct.pack(
+            "<IHHIIIIIIIIhhhh", 0, 0, 0, 0, 1000, rate, 0, count, self.max_frame_size, 0xFFFFFFFF, 0, 0, 0, self.width, self.height
+        )
+        strf = struct.pack("<IiiHH4sIiiII", 40, self.width, self.height, 1, 24, b"MJPG", self.width * self.height * 3, 0, 0, 0, 0)
+
+        header = (
+            b"RIFF"
+            + struct.pack("<I", file_size - 8)
+            + b"AVI "
+            + b"LIST"
+            + struct.pack("<I", HDRL_SIZE)
+            + b"hdrl"
+            + b"avih"
+            + struct.pack("<I", len(avih))
+            + avih
+            + b"LIST"
+            + struct.pack("<I", 4 + 8 + len(strh) + 8 + len(strf))
+            + b"strl"
+            + b"strh"
+            + struct.pack("<I", len(strh))
+            + strh
+            + b"strf"
+            + struct.pack("<I", len(strf))
+            + strf
+            + b"LIST"
+            + struct.pack("<I", self.movi_size)
+            + b"movi"
+        )
+        self.file.seek(0)
+        self.file.write(header)
+        self.file.close()
+        self.file = None
+        self.segment += 1  # frames written after closing go to a new file
+
+        # Real frame timestamps
+        with open(os.path.splitext(self.segment_path)[0] + ".timestamps.txt", "w") as f:
+            f.write("# timestamp format v2\n")
+            for timestamp in self.timestamps:
+                f.write(f"{(timestamp - self.timestamps[0]) * 1000:.3f}\n")
+
+        print(f"[INFO] Video saved as {self.segment_path}, {count} frames, {fps:.2f}fps")
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self._close_segment()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
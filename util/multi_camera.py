@@ -0,0 +1,202 @@
+import functools
+import multiprocessing
+import queue
+import time
+
+from util.device import find_device_by_vid_pid, find_devices_by_vid_pid, open_device
+from util.disk_writer import DiskWriter
+from util.encoder import EncoderPool, encode_settings
+from util.frame import Frame
+from util.isp import isp
+from util.recovery import RESCAN, RESYNC, Recovery
+from util.serial_reader import SerialReader
+from util.snapshot_protocol import reset_steps, run_steps, snapshot_steps
+
+READ_TIMEOUT = 1.0  # seconds without data
+REPORT_INTERVAL = 10.0  # seconds
+
+
+def queue_frame(frame_queue, camera, format, payload_size, buffer):
+    # Hands an encoded buffer to the common disk writer
+    frame_queue.put((camera, format, buffer, payload_size))
+
+
+def capture_worker(
+    camera,
+    port,
+    frame_queue,
+    stop_event,
+    format="jpeg",
+    vflip=False,
+    hflip=False,
+    encoders=1,
+    encoder_processes=False,
+    queue_depth=2,
+    isp_enabled=False,
+    settings=None,
+):
+    """
+    Capture loop of one camera, runs in its own process.
+    Frames are encoded by an encoder pool of this process while the next one is captured, or inline without encoders.
+    Settings of the parent process are passed in, a spawned process starts with the module defaults.
+    Errors are recovered as in the single camera loop: resync the port, reopen it, then wait for the device.
+    """
+    isp.enable(isp_enabled)
+    encoder = EncoderPool(encoders, encoder_processes, settings, queue_depth) if encoders else None
+    recovery = Recovery(name=f"Camera {camera}")
+
+    while not stop_event.is_set():
+        try:
+            print(f"[INFO] Camera {camera}: opening serial port {port}...")
+            with open_device(port) as ser:
+                reader = SerialReader(ser)
+                run_steps(reset_steps(), ser, reader, READ_TIMEOUT)
+
+                while not stop_event.is_set():
+                    result = run_steps(snapshot_steps(), ser, reader, READ_TIMEOUT)
+                    if result is None:
+                        if recovery.failed() != RESYNC:
+                            break  # reopen the port
+                        recovery.resync(ser, reader)
+                        continue
+                    recovery.succeeded()
+
+                    snapshot_header, image_data = result
+                    frame = Frame(snapshot_header, image_data, hflip=hflip, vflip=vflip)
+                    frame_format = format if not frame.is_jpeg() else "jpeg"
+                    callback = functools.partial(queue_frame, frame_queue, camera, frame_format, len(image_data))
+                    if encoder is not None:
+                        encoder.submit(frame, frame_format, callback)
+                    else:
+                        callback(bytes(frame.encoded(frame_format, settings)))
+
+        except KeyboardInterrupt:
+            break
+        except Exception as e:
+            print(f"[ERROR] Camera {camera}: {e}")
+            recovery.failed(disconnected=True)
+
+        if recovery.tier == RESCAN and not stop_event.is_set():
+            # Other ports belong to the other workers, wait for this one to come back
+            print(f"[INFO] Camera {camera}: waiting for {port} for 1 second...")
+            time.sleep(1)
+
+    if encoder is not None:
+        encoder.stop()
+        print(encoder.report())
+    print(recovery.report())
+    print(f"[INFO] Camera {camera} stopped")
+
+
+class CameraStats:
+    def __init__(self, camera, port):
+        self.camera = camera
+        self.port = port
+        self.frames = 0
+        self.bytes = 0
+        self.start_time = time.monotonic()
+
+    def add(self, size):
+        self.frames += 1
+        self.bytes += size
+
+    def __str__(self):
+        elapsed = max(time.monotonic() - self.start_time, 1e-6)
+        mbps = self.bytes * 8 / (elapsed * 1024 * 1024)
+        return f"Camera {self.camera} ({self.port}): {self.frames} frames, {self.frames / elapsed:.2f}fps, {mbps:.2f}mbit/s"
+
+
+class MultiCameraCapture:
+    """
+    Captures from all connected FrameCams at once, one capture process per camera.
+    Encoded frames of all cameras are saved by a common disk writer, files are named by camera.
+    """
+
+    def __init__(
+        self, ports=None, format="jpeg", vflip=False, hflip=False, encoders=1, encoder_processes=False, queue_depth=2, save_workers=2
+    ):
+        self.ports = ports
+        self.format = format
+        self.vflip = vflip
+        self.hflip = hflip
+        self.encoders = encoders
+        self.encoder_processes = encoder_processes
+        self.queue_depth = queue_depth
+        self.save_workers = save_workers
+
+        self.stats = {}
+
+    def run(self):
+        ports = self.ports
+        if not ports:
+            # Wait for at least one device, then take all of them
+            find_device_by_vid_pid()
+            ports = find_devices_by_vid_pid()
+        print(f"[INFO] Capturing from {len(ports)} camera(s): {', '.join(ports)}")
+
+        frame_queue = multiprocessing.Queue(maxsize=self.queue_depth * len(ports))
+        stop_event = multiprocessing.Event()
+        processes = []
+        for camera, port in enumerate(ports):
+            self.stats[camera] = CameraStats(camera, port)
+            process = multiprocessing.Process(
+                target=capture_worker,
+                args=(
+                    camera,
+                    port,
+                    frame_queue,
+                    stop_event,
+                    self.format,
+                    self.vflip,
+                    self.hflip,
+                    self.encoders,
+                    self.encoder_processes,
+                    self.queue_depth,
+                    isp.enabled,
+                    encode_settings,
+                ),
+                daemon=not self.encoder_processes,  # daemon processes can not start encoder processes
+            )
+            process.start()
+            processes.append(process)
+
+        writer = DiskWriter(workers=self.save_workers).start()
+
+        last_report_time = time.monotonic()
+        try:
+            while any(process.is_alive() for process in processes):
+                try:
+                    item = frame_queue.get(timeout=1.0)
+                except queue.Empty:
+                    item = None
+
+                if item is not None:
+                    camera, format, buffer, payload_size = item
+                    self.stats[camera].add(payload_size)
+                    writer.write(buffer, format, name=f"FrameCam{camera}", sequence=self.stats[camera].frames - 1)
+
+                # Print throughput stats
+                if time.monotonic() - last_report_time > REPORT_INTERVAL:
+                    print(self.report())
+                    last_report_time = time.monotonic()
+
+        except KeyboardInterrupt:
+            print("[INFO] Exiting...")
+        finally:
+            stop_event.set()
+            for process in processes:
+                process.join(timeout=5)
+            writer.stop()
+            print(self.report())
+            print(writer.report())
+
+    def report(self):
+        lines = ["[INFO] Multi-camera throughput:"]
+        total_frames = 0
+        total_fps = 0.0
+        for stats in self.stats.values():
+            lines.append(f"[INFO] {stats}")
+            total_frames += stats.frames
+            total_fps += stats.frames / max(time.monotonic() - stats.start_time, 1e-6)
+        lines.append(f"[INFO] Total: {total_frames} frames, {total_fps:.2f}fps")
+        return "\n".join(lines)
@@ -0,0 +1,68 @@
+from util.snapshot_header import SNAPSHOT_HEADER_SIZE, SnapshotHeader
+
+
+class RawFramer:
+    """
+    Splits a raw image byte stream into frames by size.
+    A frame is complete as soon as the expected number of bytes arrives: the image size from the snapshot header
+    if the device sends one before the payload, the configured frame size otherwise.
+    """
+
+    def __init__(self, frame_size):
+        self.frame_size = frame_size
+        self.buffer = bytearray()
+        self.header = None
+
+    def reset(self):
+        self.buffer.clear()
+        self.header = None
+
+    def pending(self):
+        return len(self.buffer)
+
+    def expected_size(self):
+        return self.header.image_size if self.header is not None else self.frame_size
+
+    def _parse_header(self):
+        # Returns False while more bytes are needed to decide if the frame has a header
+        magic = SnapshotHeader.MAGIC
+        prefix = bytes(self.buffer[: len(magic)])
+        if not magic.startswith(prefix):
+            return True  # no header
+        if len(self.buffer) < SNAPSHOT_HEADER_SIZE:
+            return False
+
+        try:
+            header = SnapshotHeader(bytes(self.buffer[:SNAPSHOT_HEADER_SIZE]))
+        except ValueError:
+            return True  # unknown format, treat as image data
+
+        if header.valid():
+            self.header = header
+            del self.buffer[:SNAPSHOT_HEADER_SIZE]
+        return True
+
+    def feed(self, chunk):
+        # Feeds received bytes, returns list of complete (header, payload) frames, header is None if not sent
+        self.buffer += chunk
+
+        frames = []
+        while self.buffer:
+            if self.header is None and not self._parse_header():
+                break
+
+            expected_size = self.expected_size()
+            if len(self.buffer) < expected_size:
+                break
+
+            frames.append((self.header, bytes(self.buffer[:expected_size])))
+            del self.buffer[:expected_size]
+            self.header = None
+
+        return frames
+
+    def flush(self):
+        # Returns incomplete frame, used when the transfer stops before the expected size
+        frame = (self.header, bytes(self.buffer))
+        self.reset()
+        return frame
@@ -1,10 +1,62 @@
+from enum import Enum, auto
+
 import numpy as np
 import cv2
 
-from util.image_proc import ImageProc
+from util.deinterleaver import band_view
+from util.encoder import encode_image
+from util.isp import isp
+from util.metrics import metrics
 from util.snapshot_header import SnapshotFormat
 
 
+class FlippedBayerFormat(Enum):
+    # Host-side only: patterns produced by flipping the raw Bayer mosaic, never sent by the device
+    # Named by their actual 2x2 layout (BAYER_CHANNELS), unlike the device RAW_GRBG8 mode, which is an RGGB mosaic
+    BAYER_GRBG8 = auto()
+    BAYER_GBRG8 = auto()
+
+
+# OpenCV demosaic conversion per raw format
+BAYER_CODES = {
+    SnapshotFormat.RAW_GRBG8: cv2.COLOR_BayerRGGB2BGR,
+    SnapshotFormat.RAW_BGGR8: cv2.COLOR_BayerBGGR2BGR,
+    FlippedBayerFormat.BAYER_GRBG8: cv2.COLOR_BayerGRBG2BGR,
+    FlippedBayerFormat.BAYER_GBRG8: cv2.COLOR_BayerGBRG2BGR,
+}
+
+# Raw formats by name, as stored in Bayer archives
+RAW_FORMATS = {format.name: format for format in BAYER_CODES}
+
+# Demosaic conversion after flipping the mosaic columns / rows
+_HFLIP_CODES = {
+    cv2.COLOR_BayerRGGB2BGR: cv2.COLOR_BayerGRBG2BGR,
+    cv2.COLOR_BayerGRBG2BGR: cv2.COLOR_BayerRGGB2BGR,
+    cv2.COLOR_BayerBGGR2BGR: cv2.COLOR_BayerGBRG2BGR,
+    cv2.COLOR_BayerGBRG2BGR: cv2.COLOR_BayerBGGR2BGR,
+}
+_VFLIP_CODES = {
+    cv2.COLOR_BayerRGGB2BGR: cv2.COLOR_BayerGBRG2BGR,
+    cv2.COLOR_BayerGBRG2BGR: cv2.COLOR_BayerRGGB2BGR,
+    cv2.COLOR_BayerBGGR2BGR: cv2.COLOR_BayerGRBG2BGR,
+    cv2.COLOR_BayerGRBG2BGR: cv2.COLOR_BayerBGGR2BGR,
+}
+_CODE_FORMATS = {code: format for format, code in BAYER_CODES.items()}
+
+# Channel (B=0, G=1, R=2) at mosaic positions (0, 0), (0, 1), (1, 0), (1, 1), as demosaiced with BAYER_CODES
+BAYER_CHANNELS = {
+    SnapshotFormat.RAW_GRBG8: (2, 1, 1, 0),
+    SnapshotFormat.RAW_BGGR8: (0, 1, 1, 2),
+    FlippedBayerFormat.BAYER_GRBG8: (1, 2, 0, 1),
+    FlippedBayerFormat.BAYER_GBRG8: (1, 0, 2, 1),
+}
+
+# Raw format after a horizontal / vertical flip
+# NOTE: derived from the demosaic codes, as the GRBG mode is demosaiced with the RGGB code
+BAYER_HFLIP = {format: _CODE_FORMATS[_HFLIP_CODES[code]] for format, code in BAYER_CODES.items()}
+BAYER_VFLIP = {format: _CODE_FORMATS[_VFLIP_CODES[code]] for format, code in BAYER_CODES.items()}
+
+
 class RawImage:
     def __init__(self, buffer, format, width, height, interleaving=None):
         # NOTE: format is raw Bayer GRBG, 8-bit
@@ -14,71 +66,80 @@ class RawImage:
         self.height = height
         self.interleaving = interleaving
 
-    def deinterleave(bayer_interleaved, interleaving):
-        height, _ = bayer_interleaved.shape
-        deinterleaved = np.empty_like(bayer_interleaved)
+    @staticmethod
+    def deinterleave(bayer_interleaved, interleaving, out=None):
+        height, width = bayer_interleaved.shape
+        if out is None:
+            out = np.empty_like(bayer_interleaved)
+
+        # lines where (original_y % interleaving == i) are stored in band i
+        band_view(out, interleaving)[...] = bayer_interleaved.reshape(interleaving, height // interleaving, width)
+
+        return out
 
-        interleaving_height = height // interleaving
-        for i in range(interleaving):
-            # lines where (original_y % interleaving == i) go to lines starting from i with step 8
-            deinterleaved[i::interleaving] = bayer_interleaved[i * interleaving_height : (i + 1) * interleaving_height : 1]
+    def to_bayer(self):
+        # Convert buffer to 2D numpy array (grayscale image)
+        if isinstance(self.buffer, np.ndarray):
+            bayer_image = self.buffer.reshape((self.height, self.width))
+        else:
+            bayer_image = np.frombuffer(self.buffer, dtype=np.uint8).reshape((self.height, self.width))
+
+        # Deinterleave
+        if self.interleaving:
+            with metrics.timer("deinterleave"):
+                bayer_image = RawImage.deinterleave(bayer_image, self.interleaving)
 
-        return deinterleaved
+        return bayer_image
 
     def horizontal_flip(self):
-        flipped_buffer = bytearray(len(self.buffer))
-        for y in range(self.height):
-            for x in range(self.width):
-                flipped_buffer[y * self.width + (self.width - 1 - x)] = self.buffer[y * self.width + x]
-        return RawImage(flipped_buffer, self.width, self.height, self.interleaving)
+        # Flipping an even number of columns swaps the colors within each Bayer row
+        format = BAYER_HFLIP[self.format] if self.width % 2 == 0 else self.format
+        return RawImage(self.to_bayer()[:, ::-1], format, self.width, self.height)
 
     def vertical_flip(self):
-        flipped_buffer = bytearray(len(self.buffer))
-        for y in range(self.height):
-            for x in range(self.width):
-                flipped_buffer[(self.height - 1 - y) * self.width + x] = self.buffer[y * self.width + x]
-        return RawImage(flipped_buffer, self.width, self.height, self.interleaving)
+        # Flipping an even number of rows swaps the Bayer rows
+        format = BAYER_VFLIP[self.format] if self.height % 2 == 0 else self.format
+        return RawImage(self.to_bayer()[::-1, :], format, self.width, self.height)
 
     def to_image(self):
-        # Convert buffer to 2D numpy array (grayscale image)
-        bayer_image = np.frombuffer(self.buffer, dtype=np.uint8).reshape((self.height, self.width))
+        bayer_image = self.to_bayer()
 
-        # Deinterleave
-        if self.interleaving:
-            bayer_image = RawImage.deinterleave(bayer_image, self.interleaving)
-
-        # Demosaic the GRBG Bayer pattern to BGR
+        # Demosaic the Bayer pattern to BGR
         # OpenCV uses BGR by default
         # see: https://docs.opencv.org/4.x/de/d25/imgproc_color_conversions.html#color_convert_bayer
-        if self.format == SnapshotFormat.RAW_GRBG8:
-            bgr_image = cv2.cvtColor(bayer_image, cv2.COLOR_BayerRGGB2BGR)
-        elif self.format == SnapshotFormat.RAW_BGGR8:
-            bgr_image = cv2.cvtColor(bayer_image, cv2.COLOR_BayerBGGR2BGR)
-        else:
+        if self.format not in BAYER_CODES:
             raise ValueError(f"Unsupported raw image format: {self.format}")
+        with metrics.timer("demosaic"):
+            bgr_image = cv2.cvtColor(bayer_image, BAYER_CODES[self.format])
 
         # Apply AWB and gamma-correction
-        # image_proc = ImageProc(bgr_image)
-        # image_proc.auto_white_balance()
-        # image_proc.gamma_correction()
-        # proc_image = image_proc.img
+        return isp.process(bgr_image)
 
-        proc_image = bgr_image
+    def to_preview(self):
+        # Half resolution BGR image, one pixel per 2x2 Bayer cell without interpolation
+        if self.format not in BAYER_CHANNELS:
+            raise ValueError(f"Unsupported raw image format: {self.format}")
+        bayer_image = self.to_bayer()
+
+        with metrics.timer("demosaic"):
+            height, width = bayer_image.shape
+            cells = bayer_image[: height - height % 2, : width - width % 2].reshape(height // 2, 2, width // 2, 2)
+            planes = [cells[:, dy, :, dx] for dy, dx in ((0, 0), (0, 1), (1, 0), (1, 1))]
+            channels = BAYER_CHANNELS[self.format]
+            green_1, green_2 = [plane for plane, channel in zip(planes, channels) if channel == 1]
+            green = cv2.addWeighted(green_1, 0.5, green_2, 0.5, 0)
+            bgr_image = cv2.merge([planes[channels.index(0)], green, planes[channels.index(2)]])
 
-        return proc_image
+        return isp.process(bgr_image)
 
-    def to_jpeg(self):
+    def to_jpeg(self, settings=None):
         bgr_image = self.to_image()
 
         # Convert to JPEG
-        _, jpeg_buffer = cv2.imencode(".jpg", bgr_image)
+        return encode_image(".jpg", bgr_image, settings)
 
-        return jpeg_buffer
-
-    def to_png(self):
+    def to_png(self, settings=None):
         bgr_image = self.to_image()
 
         # Convert to PNG
-        _, png_buffer = cv2.imencode(".png", bgr_image)
-
-        return png_buffer
+        return encode_image(".png", bgr_image, settings)
@@ -0,0 +1,79 @@
+import time
+
+from util.metrics import metrics
+
+# Recovery tiers, cheapest first
+RESYNC = "resync"  # flush the port buffers and resync the protocol, the port stays open
+REOPEN = "reopen"  # close and reopen the same port, reset the device
+RESCAN = "rescan"  # close the port and search for the device again
+TIERS = [RESYNC, REOPEN, RESCAN]
+
+# Failed recoveries in a row before escalating to the next tier
+TIER_ATTEMPTS = {RESYNC: 2, REOPEN: 2}
+
+
+class Recovery:
+    """
+    Picks the recovery tier for capture errors, escalating while no frame is received.
+    A received frame ends the recovery: it is counted for the tier that got it, with the time since the first error.
+    Recovery times are also added to the metrics as recovery_<tier> stages.
+    """
+
+    def __init__(self, attempts=TIER_ATTEMPTS, name=None):
+        self.attempts = attempts
+        self.prefix = f"{name}: " if name else ""  # tells the log lines of several cameras apart
+
+        self.tier = None  # tier of the recovery in progress
+        self.tier_attempts = 0
+        self.failed_time = None
+
+        self.counts = {tier: 0 for tier in TIERS}  # recovery attempts
+        self.recovered = {tier: 0 for tier in TIERS}  # recoveries that got a frame
+        self.seconds = {tier: 0.0 for tier in TIERS}  # time from error to frame
+
+    def failed(self, disconnected=False):
+        # Returns the tier to recover with, the port cannot be resynced if it is disconnected
+        if self.tier is None:
+            self.failed_time = time.monotonic()
+            tier = RESYNC
+        elif self.tier_attempts >= self.attempts.get(self.tier, 0):
+            tier = TIERS[min(TIERS.index(self.tier) + 1, len(TIERS) - 1)]
+        else:
+            tier = self.tier
+        if disconnected and tier == RESYNC:
+            tier = REOPEN
+
+        if tier != self.tier:
+            self.tier = tier
+            self.tier_attempts = 0
+        self.tier_attempts += 1
+        self.counts[tier] += 1
+        print(f"[WARN] {self.prefix}Recovering by {tier} (attempt {self.tier_attempts})")
+        return tier
+
+    def succeeded(self):
+        # Frame received, ends the recovery in progress
+        if self.tier is None:
+            return
+
+        seconds = time.monotonic() - self.failed_time
+        self.recovered[self.tier] += 1
+        self.seconds[self.tier] += seconds
+        metrics.add(f"recovery_{self.tier}", seconds)
+        print(f"[INFO] {self.prefix}Recovered by {self.tier} in {seconds * 1000:.0f}ms")
+        self.tier = None
+
+    def resync(self, ser, reader=None):
+        # First tier: drops everything buffered in both directions
+        ser.reset_input_buffer()
+        ser.reset_output_buffer()
+        if reader is not None:
+            reader.pending.clear()
+
+    def report(self):
+        lines = [f"[INFO] {self.prefix}Recovery report:"]
+        for tier in TIERS:
+            recovered = self.recovered[tier]
+            average = self.seconds[tier] / recovered * 1000 if recovered else 0.0
+            lines.append(f"[INFO] {tier:>8}: {self.counts[tier]} attempts, {recovered} recovered, avg {average:.0f}ms to next frame")
+        return "\n".join(lines)
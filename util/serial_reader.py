@@ -0,0 +1,92 @@
+import os
+import select
+
+
+class SerialReader:
+    """
+    Reads from a serial port without busy waiting and without allocating per read.
+    On POSIX the port file descriptor is polled and read straight into a preallocated buffer,
+    otherwise pyserial blocking reads with an inter-byte timeout are used.
+    """
+
+    def __init__(self, ser, buffer_size=64 * 1024, inter_byte_timeout=0.005):
+        self.ser = ser
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        self.inter_byte_timeout = inter_byte_timeout
+        self.pending = bytearray()  # bytes pushed back, returned first by the next reads
+
+        self.fd = None
+        self.poll = None
+        if os.name == "posix" and hasattr(os, "readv"):
+            try:
+                self.fd = ser.fileno()
+            except Exception:
+                self.fd = None  # e.g. URL handlers without file descriptor
+
+        if self.fd is not None:
+            self.poll = select.poll()
+            self.poll.register(self.fd, select.POLLIN | select.POLLERR | select.POLLHUP)
+
+    def _wait(self, timeout):
+        # Returns True if data is available within timeout (seconds)
+        events = self.poll.poll(None if timeout is None else max(0, timeout * 1000))
+        if not events:
+            return False
+        if any(event & (select.POLLERR | select.POLLHUP) and not event & select.POLLIN for _, event in events):
+            raise IOError("Serial port disconnected")
+        return True
+
+    def unread(self, data):
+        # Pushes bytes back, e.g. read past the end of a header
+        self.pending[:0] = data
+
+    def _readinto(self, view, timeout):
+        # Reads available bytes (at least one) into view, returns 0 on timeout
+        if self.pending:
+            count = min(len(view), len(self.pending))
+            view[:count] = self.pending[:count]
+            del self.pending[:count]
+            return count
+
+        if self.fd is not None:
+            if not self._wait(timeout):
+                return 0
+            try:
+                count = os.readv(self.fd, [view])
+            except BlockingIOError:
+                return 0
+            if count == 0:
+                raise IOError("Serial port disconnected")
+            return count
+
+        # Portable fallback: block for the first byte, return after a short inter-byte gap
+        # Setting a timeout reconfigures the port (SetCommTimeouts on Windows), only done when it changes
+        if self.ser.timeout != timeout:
+            self.ser.timeout = timeout
+        if self.ser.inter_byte_timeout != self.inter_byte_timeout:
+            self.ser.inter_byte_timeout = self.inter_byte_timeout
+        return self.ser.readinto(view)
+
+    def read_chunk(self, timeout=None, max_size=None):
+        # Returns memoryview of received bytes (valid until the next read), empty on timeout
+        count = self._readinto(self.view[:max_size], timeout)
+        return self.view[:count]
+
+    def read_exactly(self, size, timeout=1.0, out=None):
+        """
+        Reads size bytes into out (a new bytearray if not given) with large reads.
+        timeout is the maximum gap between received bytes, returns the received part if it expires.
+        """
+        if out is None:
+            out = bytearray(size)
+        view = memoryview(out)[:size]
+
+        received = 0
+        while received < size:
+            count = self._readinto(view[received:], timeout)
+            if count == 0:
+                break
+            received += count
+
+        return out if received == size else out[:received]
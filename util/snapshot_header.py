@@ -1,5 +1,14 @@
+import struct
 from enum import Enum
 
+# magic, format, interleaving, width, height, image size, shutter mode, gain mode, reserved (big endian)
+HEADER_STRUCT = struct.Struct(">6sBBHHIBB2s")
+SNAPSHOT_HEADER_SIZE = HEADER_STRUCT.size  # 20 bytes
+
+# Sanity limits, a header outside of them is corrupt
+MAX_DIMENSION = 8192
+MAX_IMAGE_SIZE = 64 * 1024 * 1024
+
 
 class SnapshotFormat(Enum):
     JPEG = 0
@@ -7,45 +16,71 @@ class SnapshotFormat(Enum):
     RAW_BGGR8 = 2
 
 
+# A header with any other format byte is corrupt
+_FORMATS = {format.value: format for format in SnapshotFormat}
+
+
 class SnapshotHeader:
     MAGIC = b"\x01\x02\x03\x04\x05\x06"
 
+    __slots__ = ("buffer", "magic", "format", "interleaving", "width", "height", "image_size", "shutter_mode", "gain_mode", "reserved")
+
     def __init__(self, buffer):
         self.buffer = buffer
 
         self._parse()
 
     def _parse(self):
-        # magic (6 bytes)
-        self.magic = self.buffer[0:6]
-
-        # format (1 byte)
-        self.format = SnapshotFormat(self.buffer[6])
-
-        # interleaving (1 byte)
-        self.interleaving = self.buffer[7]
-
-        # width (2 byte, big endian)
-        self.width = int.from_bytes(self.buffer[8:10], "big")
-
-        # height (2 byte, big endian)
-        self.height = int.from_bytes(self.buffer[10:12], "big")
-
-        # image size (4 byte, big endian)
-        self.image_size = int.from_bytes(self.buffer[12:16], "big")
-
-        # shutter mode (1 byte)
-        self.shutter_mode = self.buffer[16]
-
-        # gain mode (1 byte)
-        self.gain_mode = self.buffer[17]
-
-        # reserved (2 bytes)
-        self.reserved = self.buffer[18:20]
+        (
+            self.magic,
+            format,
+            self.interleaving,
+            self.width,
+            self.height,
+            self.image_size,
+            self.shutter_mode,
+            self.gain_mode,
+            self.reserved,
+        ) = HEADER_STRUCT.unpack_from(self.buffer)
+
+        self.format = _FORMATS.get(format)
+        if self.format is None:
+            raise ValueError(f"{format} is not a valid SnapshotFormat")
+
+    @staticmethod
+    def pack(format, width, height, interleaving, image_size, shutter_mode=0, gain_mode=0):
+        return HEADER_STRUCT.pack(
+            SnapshotHeader.MAGIC, format.value, interleaving, width, height, image_size, shutter_mode, gain_mode, bytes(2)
+        )
+
+    @staticmethod
+    def parse(buffer):
+        # Returns the header if buffer starts with a sane one, None otherwise
+        try:
+            header = SnapshotHeader(buffer)
+        except (ValueError, struct.error):
+            return None
+        return header if header.error() is None else None
+
+    def error(self):
+        # Returns what is wrong with the header fields, None if they are sane
+        if self.magic != SnapshotHeader.MAGIC:
+            return f"Invalid magic: {self.magic}, expected: {SnapshotHeader.MAGIC}"
+        if not (0 < self.width <= MAX_DIMENSION and 0 < self.height <= MAX_DIMENSION):
+            return f"Invalid image dimensions: {self.width}x{self.height}"
+        if not 0 < self.image_size <= MAX_IMAGE_SIZE:
+            return f"Invalid image size: {self.image_size}"
+        if self.format != SnapshotFormat.JPEG:
+            if self.image_size != self.width * self.height:
+                return f"Invalid raw image size: {self.image_size}, expected: {self.width * self.height}"
+            if self.interleaving > 1 and self.height % self.interleaving:
+                return f"Invalid interleaving: {self.interleaving} for height {self.height}"
+        return None
 
     def valid(self):
-        if self.magic != SnapshotHeader.MAGIC:
-            print(f"[ERROR] Invalid magic: {self.magic}, expected: {SnapshotHeader.MAGIC}")
+        error = self.error()
+        if error is not None:
+            print(f"[ERROR] {error}")
             return False
 
         return True
@@ -0,0 +1,281 @@
+"""
+FrameCam snapshot protocol as generators of I/O steps.
+The same protocol code is driven by blocking serial I/O (run_steps) and by asyncio transports (Transport.run).
+"""
+
+import time
+
+from util.deinterleaver import Deinterleaver
+from util.metrics import metrics
+from util.snapshot_header import SNAPSHOT_HEADER_SIZE, SnapshotFormat, SnapshotHeader
+
+RESET_CMD = b"R"
+SNAPSHOT_CMD = b"S"
+TRANSFER_CMD = b"T"
+FAST_SNAPSHOT_CMD = b"X"
+
+RESET_TIME = 1.0  # seconds
+STREAM_GAP = 0.02  # seconds, a pause this long within a response means nothing more is coming
+SCAN_CHUNK_SIZE = 64 * 1024
+MAX_SCAN_SIZE = 16 * 1024 * 1024  # bytes skipped while looking for a header before giving up
+PAYLOAD_RESUMES = 2  # short image reads are resumed, the transfer may pause for longer than the read timeout
+
+# Protocol steps yielded to the I/O driver
+WRITE = "write"  # (WRITE, data)
+READ = "read"  # (READ, size) -> received bytes, shorter on timeout
+READ_CHUNK = "read_chunk"  # (READ_CHUNK, max_size) -> received bytes, empty on timeout
+READ_AVAILABLE = "read_available"  # (READ_AVAILABLE, max_size) -> received bytes, empty if nothing arrives within STREAM_GAP
+UNREAD = "unread"  # (UNREAD, data), data is returned first by the next reads
+SLEEP = "sleep"  # (SLEEP, seconds)
+
+
+def reset_steps():
+    # Send reset command
+    yield WRITE, RESET_CMD
+    print(f"[INFO] Sent '{RESET_CMD.decode()}' to device, waiting for reset data...")
+
+    # Wait for 1 sec
+    yield SLEEP, RESET_TIME
+
+
+def drain_steps():
+    # Discards received bytes until the stream pauses, returns the number of bytes dropped
+    dropped = 0
+    while True:
+        chunk = yield READ_AVAILABLE, SCAN_CHUNK_SIZE
+        if not chunk:
+            return dropped
+        dropped += len(chunk)
+
+
+def find_header(buffer):
+    # Returns (offset, header) of the first sane header in buffer,
+    # header is None if there is none yet: offset is where one could still start once more bytes arrive
+    magic = SnapshotHeader.MAGIC
+    offset = buffer.find(magic)
+    while offset >= 0:
+        if len(buffer) - offset < SNAPSHOT_HEADER_SIZE:
+            return offset, None
+        header = SnapshotHeader.parse(bytes(buffer[offset : offset + SNAPSHOT_HEADER_SIZE]))
+        if header is not None:
+            return offset, header
+        offset = buffer.find(magic, offset + 1)
+
+    # Magic may begin in the last bytes
+    for offset in range(max(len(buffer) - len(magic) + 1, 0), len(buffer)):
+        if magic.startswith(buffer[offset:]):
+            return offset, None
+    return len(buffer), None
+
+
+def header_steps():
+    """
+    Reads the next sane snapshot header, returns (header, bytes skipped before it), header is None if none arrives.
+    Stray bytes are skipped by scanning for the magic, bytes received after the header are pushed back for the image.
+    """
+    buffer = bytearray((yield READ, SNAPSHOT_HEADER_SIZE))
+    if not buffer:
+        print("[ERROR] Could not read snapshot header")
+        return None, 0
+
+    skipped = 0
+    scans = 0
+    while skipped <= MAX_SCAN_SIZE:
+        offset, header = find_header(buffer)
+        if header is not None:
+            end = offset + SNAPSHOT_HEADER_SIZE
+            if end < len(buffer):
+                yield UNREAD, bytes(buffer[end:])
+            skipped += offset
+            if skipped:
+                print(f"[WARN] Resynchronized on snapshot header, skipped {skipped} bytes")
+            return header, skipped
+
+        if not scans:
+            print("[WARN] Invalid snapshot header, scanning for the next one...")
+        scans += 1
+        skipped += offset
+        del buffer[:offset]
+
+        # Continue while the device is sending
+        chunk = yield READ_AVAILABLE, SCAN_CHUNK_SIZE
+        if not chunk:
+            break
+        buffer += chunk
+
+    print(f"[ERROR] No valid snapshot header, {skipped + len(buffer)} bytes skipped")
+    return None, skipped
+
+
+def image_data_steps(snapshot_header, deinterleavers=None, reuse_output=True):
+    width, height, interleaving = snapshot_header.width, snapshot_header.height, snapshot_header.interleaving
+    if (
+        deinterleavers is None
+        or snapshot_header.format == SnapshotFormat.JPEG
+        or interleaving <= 1
+        or snapshot_header.image_size != width * height
+    ):
+        image_data = yield READ, snapshot_header.image_size
+        resumes = 0
+        while len(image_data) < snapshot_header.image_size:
+            # Keep the received part and wait for the rest
+            if resumes == PAYLOAD_RESUMES:
+                print(f"[ERROR] Image transfer stopped at {len(image_data)} of {snapshot_header.image_size} bytes")
+                return None
+            resumes += 1
+            print(f"[WARN] Image transfer paused at {len(image_data)} of {snapshot_header.image_size} bytes, resuming...")
+            image_data += yield READ, snapshot_header.image_size - len(image_data)
+        return image_data
+
+    # Deinterleave raw image while it is received
+    deinterleaver = deinterleavers.get((width, height, interleaving))
+    if deinterleaver is None:
+        deinterleaver = Deinterleaver(width, height, interleaving, reuse_output)
+        deinterleavers[(width, height, interleaving)] = deinterleaver
+
+    deinterleaver.reset()
+    deinterleave_time = 0.0
+    resumes = 0
+    while not deinterleaver.done():
+        chunk = yield READ_CHUNK, deinterleaver.frame_size - deinterleaver.received
+        if not chunk:
+            # Keep the received part and wait for the rest
+            if resumes == PAYLOAD_RESUMES:
+                print(f"[ERROR] Image transfer stopped at {deinterleaver.received} of {deinterleaver.frame_size} bytes")
+                return None
+            resumes += 1
+            print(f"[WARN] Image transfer paused at {deinterleaver.received} of {deinterleaver.frame_size} bytes, resuming...")
+            continue
+        if metrics.enabled:
+            start = time.perf_counter()
+            deinterleaver.feed(chunk)
+            deinterleave_time += time.perf_counter() - start
+        else:
+            deinterleaver.feed(chunk)
+
+    metrics.add("deinterleave", deinterleave_time)
+    return deinterleaver.output
+
+
+def snapshot_steps(deinterleavers=None, reuse_output=True, cmd=SNAPSHOT_CMD):
+    # Returns (snapshot header, image data) or None
+    # Send snapshot command
+    yield WRITE, cmd
+    print(f"[INFO] Sent '{cmd.decode()}' to device, waiting for snapshot to be done...")
+    start = time.perf_counter()
+
+    # Read snapshot header (20 bytes), stray bytes before it are skipped
+    snapshot_header, _ = yield from header_steps()
+    metrics.add("header_wait", time.perf_counter() - start)
+    if snapshot_header is None:
+        return None
+
+    # Start image transfer
+    yield WRITE, TRANSFER_CMD
+    print(f"[INFO] Sent '{TRANSFER_CMD.decode()}' to device, waiting for image...")
+
+    # Read image
+    start_time = time.perf_counter()
+    image_data = yield from image_data_steps(snapshot_header, deinterleavers, reuse_output)
+    if image_data is None:
+        print("[ERROR] Could not read image")
+        yield from drain_steps()
+        return None
+
+    # Calculate transmission time
+    end_time = time.perf_counter()
+    metrics.add("transfer", end_time - start_time)
+    kb = snapshot_header.image_size / 1024
+    mbps = snapshot_header.image_size * 8 / ((end_time - start_time) * 1024 * 1024)
+    print(f"[INFO] Transfer done, {kb:.1f}kb, speed: {mbps:.2f}mbit/s")
+
+    return snapshot_header, image_data
+
+
+class PipelinedSnapshots:
+    """
+    Keeps snapshot requests in flight, so the device takes the next snapshot while the host processes the current one.
+    Snapshot and transfer commands are sent together and the device answers them in order:
+    every request is answered by a header and its image, the host tracks the requests that are not answered yet.
+    A corrupt header is skipped by scanning for the header of the next response.
+    If a response goes missing or no header is found, the responses in flight are dropped and the requests are sent again.
+    """
+
+    def __init__(self, depth=1, cmd=SNAPSHOT_CMD):
+        self.depth = depth  # requests in flight while a frame is processed
+        self.cmd = cmd
+        self.outstanding = 0
+        self.resyncs = 0
+
+    def _fill_steps(self, target):
+        # Top up requests in flight to target
+        missing = target - self.outstanding
+        if missing > 0:
+            yield WRITE, (self.cmd + TRANSFER_CMD) * missing
+            self.outstanding += missing
+
+    def resync_steps(self):
+        # Drop the responses in flight by reading until the device is quiet
+        print(f"[WARN] Resyncing snapshot pipeline, dropping {self.outstanding} request(s)")
+        self.resyncs += 1
+        yield from drain_steps()
+        self.outstanding = 0
+
+    def snapshot_steps(self, deinterleavers=None, reuse_output=True):
+        # Returns (snapshot header, image data) of the oldest request or None
+        yield from self._fill_steps(max(self.depth, 1))
+
+        # Read snapshot header (20 bytes), stray bytes before it are skipped
+        start = time.perf_counter()
+        snapshot_header, skipped = yield from header_steps()
+        metrics.add("header_wait", time.perf_counter() - start)
+        if snapshot_header is None:
+            yield from self.resync_steps()
+            return None
+        if skipped >= SNAPSHOT_HEADER_SIZE and self.outstanding > 1:
+            # The skipped bytes were a corrupt response, this header answers the next request
+            self.outstanding -= 1
+
+        # Read image
+        start_time = time.perf_counter()
+        image_data = yield from image_data_steps(snapshot_header, deinterleavers, reuse_output)
+        if image_data is None:
+            print("[ERROR] Could not read image")
+            yield from self.resync_steps()
+            return None
+        self.outstanding -= 1
+
+        # Request the next snapshots right away, they are taken while this one is processed
+        yield from self._fill_steps(self.depth)
+
+        # Calculate transmission time
+        end_time = time.perf_counter()
+        metrics.add("transfer", end_time - start_time)
+        kb = snapshot_header.image_size / 1024
+        mbps = snapshot_header.image_size * 8 / ((end_time - start_time) * 1024 * 1024)
+        print(f"[INFO] Transfer done, {kb:.1f}kb, speed: {mbps:.2f}mbit/s, {self.outstanding} request(s) in flight")
+
+        return snapshot_header, image_data
+
+
+def run_steps(steps, ser, reader, timeout=1.0):
+    # Drives protocol steps with blocking serial I/O, returns the protocol result
+    result = None
+    try:
+        while True:
+            op, arg = steps.send(result)
+            result = None
+            if op == WRITE:
+                ser.write(arg)
+            elif op == READ:
+                result = reader.read_exactly(arg, timeout)
+            elif op == READ_CHUNK:
+                result = reader.read_chunk(timeout, arg)
+            elif op == READ_AVAILABLE:
+                result = reader.read_chunk(STREAM_GAP, arg)
+            elif op == UNREAD:
+                reader.unread(arg)
+            elif op == SLEEP:
+                time.sleep(arg)
+    except StopIteration as e:
+        return e.value
@@ -0,0 +1,219 @@
+import asyncio
+import os
+
+import serial
+
+from util.snapshot_protocol import READ, READ_AVAILABLE, READ_CHUNK, SLEEP, STREAM_GAP, UNREAD, WRITE
+
+BAUDRATE = 460800
+CHUNK_SIZE = 64 * 1024
+BLOCKING_READ_TIMEOUT = 0.05  # seconds, serial timeout of executor reads on ports without a file descriptor
+
+
+class Transport:
+    """
+    Asyncio byte transport to a FrameCam, drives the snapshot protocol steps.
+    Subclasses implement open(), close(), write() and _read_some().
+    """
+
+    pending = b""  # bytes pushed back by the protocol, returned first by the next reads
+    eof = False  # end of stream reached, no more data will arrive
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def write(self, data):
+        raise NotImplementedError
+
+    async def _read_some(self, max_size):
+        # Returns at least one byte, b"" at end of stream
+        raise NotImplementedError
+
+    def unread(self, data):
+        self.pending = bytes(data) + self.pending
+
+    async def read_chunk(self, timeout=1.0, max_size=CHUNK_SIZE):
+        # Returns received bytes, empty on timeout
+        if self.pending:
+            data, self.pending = self.pending[:max_size], self.pending[max_size:]
+            return data
+        try:
+            data = await asyncio.wait_for(self._read_some(max_size), timeout)
+        except asyncio.TimeoutError:
+            return b""
+        if not data:
+            self.eof = True
+        return data
+
+    async def read_exactly(self, size, timeout=1.0):
+        # Returns size bytes, fewer if there was no data for timeout seconds
+        buffer = bytearray()
+        while len(buffer) < size:
+            chunk = await self.read_chunk(timeout, size - len(buffer))
+            if not chunk:
+                break
+            buffer += chunk
+        return buffer
+
+    async def run(self, steps, timeout=1.0):
+        # Drives protocol steps, returns the protocol result
+        result = None
+        try:
+            while True:
+                op, arg = steps.send(result)
+                result = None
+                if op == WRITE:
+                    await self.write(arg)
+                elif op == READ:
+                    result = await self.read_exactly(arg, timeout)
+                elif op == READ_CHUNK:
+                    result = await self.read_chunk(timeout, arg)
+                elif op == READ_AVAILABLE:
+                    result = await self.read_chunk(STREAM_GAP, arg)
+                elif op == UNREAD:
+                    self.unread(arg)
+                elif op == SLEEP:
+                    await asyncio.sleep(arg)
+        except StopIteration as e:
+            return e.value
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+class SerialTransport(Transport):
+    # pyserial port or URL (COM3, /dev/ttyACM0, loop://, rfc2217://...)
+
+    def __init__(self, url, baudrate=BAUDRATE):
+        self.url = url
+        self.baudrate = baudrate
+        self.ser = None
+        self.fd = None
+        self.read_future = None  # executor read, kept across read timeouts
+
+    async def open(self):
+        self.ser = serial.serial_for_url(self.url, baudrate=self.baudrate, timeout=0)
+        try:
+            self.fd = self.ser.fileno() if os.name == "posix" else None
+        except Exception:
+            self.fd = None
+        if self.fd is None:
+            self.ser.timeout = BLOCKING_READ_TIMEOUT
+
+    async def close(self):
+        if self.read_future is not None:
+            # Let the executor read finish before the port goes away
+            await asyncio.wait([self.read_future])
+            self.read_future = None
+        if self.ser is not None and self.ser.is_open:
+            self.ser.close()
+
+    async def write(self, data):
+        self.ser.write(data)
+
+    async def _read_some(self, max_size):
+        loop = asyncio.get_running_loop()
+        if self.fd is None:
+            # No file descriptor to watch: blocking read with a short timeout in the executor.
+            # Only one read is pending at a time: when the caller times out, the read is not abandoned
+            # but awaited again by the next call, so its bytes are not lost and reads do not race on the port.
+            while True:
+                if self.read_future is None:
+                    self.read_future = loop.run_in_executor(None, self._blocking_read, CHUNK_SIZE)
+                try:
+                    data = await asyncio.shield(self.read_future)
+                finally:
+                    if self.read_future.done():
+                        self.read_future = None
+                if data:
+                    if len(data) > max_size:
+                        self.unread(data[max_size:])
+                        data = data[:max_size]
+                    return data
+
+        # Wait for the port to become readable
+        while True:
+            data = self.ser.read(max_size)
+            if data:
+                return data
+            readable = loop.create_future()
+            loop.add_reader(self.fd, readable.set_result, None)
+            try:
+                await readable
+            finally:
+                loop.remove_reader(self.fd)
+
+    def _blocking_read(self, max_size):
+        return self.ser.read(max(1, min(max_size, self.ser.in_waiting)))
+
+
+class StreamTransport(Transport):
+    # TCP connection, socket://host:port
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def open(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
+
+    async def write(self, data):
+        self.writer.write(data)
+        await self.writer.drain()
+
+    async def _read_some(self, max_size):
+        return await self.reader.read(max_size)
+
+
+class FileReplayTransport(Transport):
+    """
+    Replays a recorded device byte stream, file://path.
+    Commands are ignored, the recording must contain the responses in order.
+    """
+
+    def __init__(self, path, bytes_per_sec=None):
+        self.path = path
+        self.bytes_per_sec = bytes_per_sec  # throttle to a link speed, None for full speed
+        self.file = None
+
+    async def open(self):
+        self.file = open(self.path, "rb")
+
+    async def close(self):
+        if self.file is not None:
+            self.file.close()
+
+    async def write(self, data):
+        pass
+
+    async def _read_some(self, max_size):
+        data = self.file.read(max_size)
+        if not data:
+            return b""  # end of recording
+        if self.bytes_per_sec:
+            await asyncio.sleep(len(data) / self.bytes_per_sec)
+        return data
+
+
+def open_transport(url, baudrate=BAUDRATE):
+    # Creates transport for a port name or URL (socket://host:port, file://path, pyserial URLs)
+    if url.startswith("socket://"):
+        host, port = url[len("socket://") :].rsplit(":", 1)
+        return StreamTransport(host, int(port))
+    if url.startswith("file://"):
+        return FileReplayTransport(url[len("file://") :])
+    return SerialTransport(url, baudrate)